@@ -0,0 +1,46 @@
+# Una formula sobre muchas filas: calc.run por fila contra calc.eval_batch (necesita numpy)
+# python3 benchmarks/bench_batch.py [filas] [engine]
+
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import numpy
+
+import calc
+
+FORMULA = 'IF y != 0 THEN x ^ 2 + 10 / y * 3 > 10 AND y != 0 ELSE x - 1'
+
+def main():
+	rows = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+	engine = sys.argv[2] if len(sys.argv) > 2 else 'vm'
+
+	random.seed(0)
+	x = [random.uniform(-10, 10) for _ in range(rows)]
+	y = [random.randint(-3, 3) for _ in range(rows)]
+
+	start = time.perf_counter()
+	expected = []
+	for x_value, y_value in zip(x, y):
+		calc.global_symbol_table.set('x', calc.make_number(x_value))
+		calc.global_symbol_table.set('y', calc.make_number(y_value))
+		value, error = calc.run('<bench>', FORMULA, engine)
+		expected.append(value.value)
+	row_time = time.perf_counter() - start
+
+	start = time.perf_counter()
+	batch, error = calc.eval_batch('<bench>', FORMULA, {'x': numpy.array(x), 'y': numpy.array(y)})
+	batch_time = time.perf_counter() - start
+	if error: raise Exception(error.as_string())
+
+	assert not batch.failed.any() and numpy.allclose(batch.values, expected)
+	print(f'{rows} rows, {engine} engine per row')
+	print(f'{"run":<12}{row_time * 1000:>10.1f}ms')
+	print(f'{"eval_batch":<12}{batch_time * 1000:>10.1f}ms')
+	print(f'speedup {row_time / batch_time:.0f}x')
+
+if __name__ == '__main__':
+	main()
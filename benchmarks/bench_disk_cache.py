@@ -0,0 +1,76 @@
+# Arranque en frio contra arranque en caliente de un script con la cache en disco
+# python3 benchmarks/bench_disk_cache.py [terms] [runs] [engine]
+
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+
+TERM = '(x1 + 42) * 3.14 - "hello world" * 2 + IF count != 10 THEN total ^ 2 ELSE y_2 / 7'
+
+# Runs in a fresh interpreter, like a short-lived worker: prints the time
+# spent in calc.compile_program, the part the cache can save
+WORKER = '''
+import sys, time
+sys.path.insert(0, sys.argv[1])
+import calc
+text = open(sys.argv[2], encoding='utf-8').read()
+disk_cache = calc.DiskCache(sys.argv[3]) if sys.argv[3] else None
+start = time.perf_counter()
+program, error = calc.compile_program(sys.argv[2], text, sys.argv[4], True, disk_cache)
+elapsed = time.perf_counter() - start
+if error: raise Exception(error.as_string())
+print(elapsed)
+'''
+
+def generate(terms):
+	# Balanced so the tree stays shallow however many terms there are
+	parts = [TERM] * terms
+	while len(parts) > 1:
+		pairs = [f'({parts[i]}) + ({parts[i + 1]})' for i in range(0, len(parts) - 1, 2)]
+		parts = pairs + (parts[-1:] if len(parts) % 2 else [])
+	return parts[0]
+
+def worker(script, cache_dir, engine):
+	start = time.perf_counter()
+	output = subprocess.check_output([sys.executable, '-c', WORKER, ROOT, script, cache_dir or '', engine], text=True)
+	return float(output), time.perf_counter() - start
+
+def main():
+	terms = int(sys.argv[1]) if len(sys.argv) > 1 else 2048
+	runs = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+	engine = sys.argv[3] if len(sys.argv) > 3 else 'vm'
+
+	with tempfile.TemporaryDirectory() as directory:
+		script = os.path.join(directory, 'script.calc')
+		with open(script, 'w', encoding='utf-8') as f:
+			f.write(generate(terms))
+
+		cache_dir = os.path.join(directory, 'cache')
+		results = {'no cache': [], 'cold': [], 'warm': []}
+
+		for _ in range(runs):
+			results['no cache'].append(worker(script, None, engine))
+
+			for name in os.listdir(cache_dir) if os.path.isdir(cache_dir) else []:
+				os.unlink(os.path.join(cache_dir, name))
+			results['cold'].append(worker(script, cache_dir, engine))
+
+			results['warm'].append(worker(script, cache_dir, engine))
+
+		print(f'{os.path.getsize(script) / 1024:.0f} KB script, {engine} engine, best of {runs} processes')
+		print(f'{"":<12}{"compile":>10}{"process":>10}')
+		for name, times in results.items():
+			compile_time = min(t[0] for t in times)
+			process_time = min(t[1] for t in times)
+			print(f'{name:<12}{compile_time * 1000:>8.1f}ms{process_time * 1000:>8.1f}ms')
+
+		no_cache = min(t[0] for t in results['no cache'])
+		warm = min(t[0] for t in results['warm'])
+		print(f'warm start compiles {no_cache / warm:.1f}x faster')
+
+if __name__ == '__main__':
+	main()
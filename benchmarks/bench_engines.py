@@ -0,0 +1,65 @@
+# Compara el interprete (tree-walker) contra los closures compilados y la VM
+# python3 benchmarks/bench_engines.py
+
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import calc
+
+PROGRAMS = [
+	('for_arith', 'VAR total = 0', 'FOR i = 0 TO 20000 THEN VAR total = total + i * 2 - 1'),
+	('while_count', 'VAR n = 0', 'WHILE n < 20000 THEN VAR n = n + 1'),
+	('for_if', 'VAR total = 0', 'FOR i = 0 TO 20000 THEN IF i > 10000 THEN VAR total = total + 1 ELIF i == 5 THEN 0 ELSE total'),
+	('nested_for', 'VAR total = 0', 'FOR i = 0 TO 150 THEN FOR j = 0 TO 150 THEN VAR total = total + j')
+]
+
+def parse(text):
+	tokens, error = calc.Lexer('<bench>', text).make_tokens()
+	if error: raise Exception(error.as_string())
+	ast = calc.Parser(tokens, calc.Source("<bench>", text)).parse()
+	if ast.error: raise Exception(ast.error.as_string())
+	return ast.node
+
+def bench(setup, text, repeat):
+	node = parse(text)
+	context = calc.Context('<program>')
+	context.symbol_table = calc.global_symbol_table
+	interpreter = calc.Interpreter()
+	resolved = calc.compile_node(node, 'interpreter')
+	program = calc.compile_node(node, 'closure')
+	bytecode = calc.compile_node(node, 'vm')
+	vm = calc.VM()
+
+	def interpret():
+		calc.run('<bench>', setup)
+		interpreter.visit(resolved, context)
+
+	def closure():
+		calc.run('<bench>', setup)
+		program(context)
+
+	def virtual_machine():
+		calc.run('<bench>', setup)
+		vm.run(bytecode, context)
+
+	return [
+		min(timeit.repeat(engine, number=1, repeat=repeat))
+		for engine in (interpret, closure, virtual_machine)
+	]
+
+def main():
+	repeat = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+	print(f'{"program":<14}{"interpreter":>14}{"closure":>14}{"vm":>14}{"closure x":>11}{"vm x":>9}')
+
+	for name, setup, text in PROGRAMS:
+		interpreter, closure, vm = bench(setup, text, repeat)
+		print(
+			f'{name:<14}{interpreter * 1000:>12.1f}ms{closure * 1000:>12.1f}ms{vm * 1000:>12.1f}ms'
+			f'{interpreter / closure:>10.2f}x{interpreter / vm:>8.2f}x'
+		)
+
+if __name__ == '__main__':
+	main()
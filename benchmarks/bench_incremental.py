@@ -0,0 +1,55 @@
+# Latencia de una edicion con calc.IncrementalParser contra lexear y parsear todo de nuevo, por tamano
+# python3 benchmarks/bench_incremental.py [ediciones] [tamano maximo en KB]
+
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import calc
+
+TERM = '(x1 + 42) * 3.14 - "hello world" >= y_2 AND (IF count != 10 THEN total ^ -2 <= 7 ELSE n)'
+ATOMS = ['x', '12', 'total', '3.5', '(a + 1)', '-y ^ 2', '(IF a THEN b ELSE c)']
+
+def full_parse(text):
+	tokens, error = calc.Lexer('<bench>', text).make_tokens()
+	if error: raise Exception(error.as_string())
+	return calc.Parser(tokens, calc.Source('<bench>', text)).parse()
+
+def main():
+	sys.setrecursionlimit(10000)
+	edits = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+	max_size = int(sys.argv[2]) if len(sys.argv) > 2 else 1024
+	random.seed(0)
+
+	print(f'{"size":>8}{"full parse":>13}{"edit":>11}{"speedup":>9}')
+	size = 1
+	while size <= max_size:
+		text = ' OR '.join([TERM] * max(1, size * 1024 // (len(TERM) + 4)))
+
+		start = time.perf_counter()
+		full_parse(text)
+		full = time.perf_counter() - start
+
+		document = calc.IncrementalParser('<bench>', text)
+		elapsed = 0
+		for _ in range(edits):
+			# Replace a random number or name with another expression
+			tok = random.choice(document.tokens[:-1])
+			while tok.type not in (calc.t_INT, calc.t_FLOAT, calc.t_IDENTIFIER):
+				tok = random.choice(document.tokens[:-1])
+
+			start = time.perf_counter()
+			node, error = document.edit(tok.pos_start, tok.pos_end - tok.pos_start, random.choice(ATOMS))
+			elapsed += time.perf_counter() - start
+			if error: raise Exception(error.as_string())
+
+		assert not full_parse(document.text).error
+		edit = elapsed / edits
+		print(f'{str(size) + "KB":>8}{full * 1000:>11.2f}ms{edit * 1000:>9.3f}ms{full / edit:>8.0f}x')
+		size *= 4
+
+if __name__ == '__main__':
+	main()
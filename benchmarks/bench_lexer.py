@@ -0,0 +1,41 @@
+# Mide el Lexer sobre un programa generado de varios MB
+# python3 benchmarks/bench_lexer.py [MB] [revision]
+
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import calc
+import reference
+
+CHUNK = '(x1 + 42) * 3.14 - "hello world" >= y_2 AND IF count != 10 THEN VAR total = total ^ 2 <= 7 ELSE '
+
+def generate(size):
+	return CHUNK * (size // len(CHUNK) + 1)
+
+def bench(module, text):
+	start = time.perf_counter()
+	tokens, error = module.Lexer('<bench>', text).make_tokens()
+	elapsed = time.perf_counter() - start
+	if error: raise Exception(error.as_string())
+	return elapsed, len(tokens)
+
+def main():
+	size = int(float(sys.argv[1]) * 1024 * 1024) if len(sys.argv) > 1 else 1024 * 1024
+	old = reference.load_calc(sys.argv[2] if len(sys.argv) > 2 else None)
+	text = generate(size)
+
+	new_time, count = bench(calc, text)
+	old_time, old_count = bench(old, text)
+	assert count == old_count
+
+	mb = len(text) / 1024 / 1024
+	print(f'{mb:.1f} MB, {count} tokens')
+	print(f'{"reference":<12}{old_time:>9.3f}s{mb / old_time:>9.2f} MB/s{count / old_time / 1e6:>8.2f} Mtok/s')
+	print(f'{"current":<12}{new_time:>9.3f}s{mb / new_time:>9.2f} MB/s{count / new_time / 1e6:>8.2f} Mtok/s')
+	print(f'speedup {old_time / new_time:.1f}x')
+
+if __name__ == '__main__':
+	main()
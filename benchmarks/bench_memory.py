@@ -0,0 +1,72 @@
+# Mide los bytes por token, por nodo del AST y por valor, contra otra revision
+# python3 benchmarks/bench_memory.py [revision]
+
+import inspect
+import os
+import sys
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import calc
+import reference
+
+TEXT = ' + '.join(f'(x{i} * {i}.5 - "s{i}") ^ 2' for i in range(20000))
+VALUES = 100000
+
+def measure(build):
+	tracemalloc.start()
+	result = build()
+	size = tracemalloc.get_traced_memory()[0]
+	tracemalloc.stop()
+	return result, size
+
+def parse(module, tokens):
+	# Parser(tokens) before positions became offsets, Parser(tokens, source) after
+	if 'source' in inspect.signature(module.Parser).parameters:
+		return module.Parser(tokens, module.Source('<bench>', TEXT)).parse().node
+	return module.Parser(tokens).parse().node
+
+def visit(module, interpreter, node, context):
+	# Visits returned an RTResult before the interpreter raised its errors
+	result = interpreter.visit(node, context)
+	return result.value if hasattr(module, 'RTResult') else result
+
+def count_nodes(node):
+	# TEXT only has binary, unary, number, string and variable nodes
+	count, stack = 0, [node]
+	while stack:
+		node = stack.pop()
+		count += 1
+		if hasattr(node, 'left_node'):
+			stack.extend((node.left_node, node.right_node))
+		elif hasattr(node, 'node'):
+			stack.append(node.node)
+	return count
+
+def bytes_per_item(module):
+	tokens, size = measure(lambda: module.Lexer('<bench>', TEXT).make_tokens()[0])
+	per_token = size / len(tokens)
+
+	node, size = measure(lambda: parse(module, tokens))
+	per_node = size / count_nodes(node)
+
+	context = module.Context('<program>')
+	number = module.NumberNode(tokens[2])
+	interpreter = module.Interpreter()
+	values, size = measure(lambda: [visit(module, interpreter, number, context) for _ in range(VALUES)])
+	per_value = size / len(values)
+
+	return per_token, per_node, per_value
+
+def main():
+	old = reference.load_calc(sys.argv[1] if len(sys.argv) > 1 else None)
+	before = bytes_per_item(old)
+	after = bytes_per_item(calc)
+
+	print(f'{"bytes per":<10}{"before":>10}{"after":>10}')
+	for name, old_size, new_size in zip(('token', 'node', 'value'), before, after):
+		print(f'{name:<10}{old_size:>10.1f}{new_size:>10.1f}')
+
+if __name__ == '__main__':
+	main()
@@ -0,0 +1,80 @@
+# Mide solo el Parser (los tokens se generan antes) contra otra revision
+# python3 benchmarks/bench_parser.py [revision] [repeticiones]
+
+import gc
+import inspect
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import calc
+import reference
+
+TERM = '(x1 + 42) * 3.14 - "hello world" >= y_2 AND (IF count != 10 THEN total ^ -2 <= 7 ELSE n)'
+
+PROGRAMS = {
+	# One long chain at a single level
+	'chain': ' + '.join(f'x{i}' for i in range(20000)),
+	# Every level of the grammar, joined by OR
+	'mixed': ' OR '.join([TERM] * 2000),
+	# Many short programs, like a cache-cold service
+	'short': ['VAR a = b * 2 + 1', 'IF x > 3 THEN x ELSE -x', 'FOR i = 0 TO 10 THEN VAR t = t + i ^ 2'] * 2000,
+	# Nested parentheses
+	'nested': '(' * 150 + '1' + ' + 1)' * 150
+}
+
+def parser(module, tokens, text):
+	# Parser(tokens) before positions became offsets, Parser(tokens, source) after
+	if 'source' in inspect.signature(module.Parser).parameters:
+		return module.Parser(tokens, module.Source('<bench>', text))
+	return module.Parser(tokens)
+
+def shape(node):
+	# Node kinds and token values in depth-first order, positions left out
+	out, stack = [], [node]
+	while stack:
+		node = stack.pop()
+		if isinstance(node, (list, tuple)):
+			stack.extend(reversed(node))
+		elif node is not None:
+			tok = getattr(node, 'tok', None) or getattr(node, 'op_tok', None) or getattr(node, 'var_name_tok', None)
+			out.append((type(node).__name__, tok and tok.type, tok and tok.value))
+			for name in ('left_node', 'right_node', 'node', 'value_node', 'cases', 'else_case', 'start_value_node',
+				'end_value_node', 'step_value_node', 'condition_node', 'body_node'):
+				if hasattr(node, name): stack.append(getattr(node, name))
+	return out
+
+def bench(module, texts, repeat):
+	lexed = []
+	for text in texts:
+		tokens, error = module.Lexer('<bench>', text).make_tokens()
+		if error: raise Exception(error.as_string())
+		lexed.append((tokens, text))
+
+	best = None
+	for _ in range(repeat):
+		gc.collect()
+		start = time.perf_counter()
+		nodes = [parser(module, tokens, text).parse().node for tokens, text in lexed]
+		elapsed = time.perf_counter() - start
+		best = elapsed if best is None else min(best, elapsed)
+
+	return best, sum(len(tokens) for tokens, _ in lexed), [shape(node) for node in nodes]
+
+def main():
+	sys.setrecursionlimit(10000)
+	old = reference.load_calc(sys.argv[1] if len(sys.argv) > 1 else None)
+	repeat = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+
+	print(f'{"program":<10}{"tokens":>9}{"reference":>12}{"current":>12}{"speedup":>9}')
+	for name, texts in PROGRAMS.items():
+		texts = texts if isinstance(texts, list) else [texts]
+		old_time, count, old_shapes = bench(old, texts, repeat)
+		new_time, _, new_shapes = bench(calc, texts, repeat)
+		assert old_shapes == new_shapes, f'{name}: different AST'
+		print(f'{name:<10}{count:>9}{old_time * 1000:>10.1f}ms{new_time * 1000:>10.1f}ms{old_time / new_time:>8.2f}x')
+
+if __name__ == '__main__':
+	main()
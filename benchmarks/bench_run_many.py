@@ -0,0 +1,48 @@
+# Escalado de calc.run_many de 1 a N procesos contra calc.run en un solo proceso
+# python3 benchmarks/bench_run_many.py [programas] [max procesos] [engine]
+
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import calc
+
+# Independent programs: none reads a variable another one assigns
+TEMPLATES = [
+	'FOR i = 0 TO {n} THEN VAR t = i * {n} + 1',
+	'IF {n} > 50 THEN ({n} + 1) ^ 2 ELIF {n} == 7 THEN 1 / 0 ELSE "x" * {n}',
+	'(VAR a = {n} * 3.5) - 2 ^ ({n} / 10) >= {n} AND {n} != 3',
+	'undefined_{n} + 1'
+]
+
+def generate(count):
+	return [(f'<script {i}>', TEMPLATES[i % len(TEMPLATES)].format(n=i % 100)) for i in range(count)]
+
+def main():
+	count = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+	max_workers = int(sys.argv[2]) if len(sys.argv) > 2 else (os.cpu_count() or 1)
+	engine = sys.argv[3] if len(sys.argv) > 3 else 'vm'
+	programs = generate(count)
+
+	start = time.perf_counter()
+	expected = [calc.run(fn, text, engine) for fn, text in programs]
+	single = time.perf_counter() - start
+
+	print(f'{count} programs, {engine} engine, {os.cpu_count()} CPUs')
+	print(f'{"workers":<10}{"time":>10}{"programs/s":>12}{"speedup":>9}')
+	print(f'{"run":<10}{single:>9.2f}s{count / single:>12.0f}{1:>8.2f}x')
+
+	workers = 1
+	while workers <= max_workers:
+		start = time.perf_counter()
+		results = list(calc.run_many(programs, engine, workers=workers))
+		elapsed = time.perf_counter() - start
+
+		assert [repr(value) for _, value, _ in results] == [repr(value) for value, _ in expected]
+		print(f'{workers:<10}{elapsed:>9.2f}s{count / elapsed:>12.0f}{single / elapsed:>8.2f}x')
+		workers *= 2
+
+if __name__ == '__main__':
+	main()
@@ -0,0 +1,81 @@
+# Generador de carga para server.py: conexiones con muchas peticiones en vuelo, todo en localhost
+# python3 benchmarks/bench_server.py [conexiones] [peticiones por conexion] [procesos]
+
+import asyncio
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import server
+
+REQUESTS = [
+	{'text': 'x ^ 2 + y * 3 > 10 AND y != 0', 'variables': {'x': 3, 'y': 1}},
+	{'text': 'FOR i = 0 TO 200 THEN VAR t = i * 2'},
+	{'text': 'IF x == 7 THEN 1 / 0 ELSE "a" * x', 'variables': {'x': 7}},
+	{'text': 'name + "!"', 'variables': {'name': 'calc'}}
+]
+
+async def client(port, count, latencies):
+	reader, writer = await asyncio.open_connection('127.0.0.1', port)
+	sent = {}
+
+	async def send():
+		for i in range(count):
+			request = dict(REQUESTS[i % len(REQUESTS)], id=i)
+			sent[i] = time.perf_counter()
+			writer.write(json.dumps(request).encode() + b'\n')
+			await writer.drain()
+
+	sender = asyncio.create_task(send())
+	for _ in range(count):
+		response = json.loads(await reader.readline())
+		latencies.append(time.perf_counter() - sent[response['id']])
+	await sender
+
+	writer.close()
+	await writer.wait_closed()
+
+async def request(port, body):
+	reader, writer = await asyncio.open_connection('127.0.0.1', port)
+	writer.write(json.dumps(body).encode() + b'\n')
+	response = json.loads(await reader.readline())
+	writer.close()
+	await writer.wait_closed()
+	return response
+
+async def main():
+	connections = int(sys.argv[1]) if len(sys.argv) > 1 else 8
+	count = int(sys.argv[2]) if len(sys.argv) > 2 else 500
+	workers = int(sys.argv[3]) if len(sys.argv) > 3 else None
+
+	calc_server = server.Server(workers, timeout=5.0)
+	listener = await calc_server.start(port=0)
+	port = listener.sockets[0].getsockname()[1]
+
+	async with listener:
+		for body in REQUESTS:
+			print(f'{body["text"]:<36} -> {await request(port, body)}')
+
+		latencies = []
+		start = time.perf_counter()
+		await asyncio.gather(*(client(port, count, latencies) for _ in range(connections)))
+		elapsed = time.perf_counter() - start
+
+		latencies.sort()
+		total = connections * count
+		print(f'{connections} connections x {count} pipelined requests, {calc_server.size} workers')
+		print(f'{total / elapsed:.0f} requests/s, latency p50 {latencies[total // 2] * 1000:.1f}ms, p99 {latencies[total * 99 // 100] * 1000:.1f}ms')
+
+		# A runaway loop is stopped at its deadline and the server keeps going
+		start = time.perf_counter()
+		response = await request(port, {'id': 'runaway', 'text': 'WHILE 1 THEN 0', 'timeout': 0.5})
+		print(f'runaway WHILE -> {response["error"]!r} after {time.perf_counter() - start:.2f}s')
+		print(f'next request -> {await request(port, REQUESTS[0])}')
+
+	await calc_server.close()
+
+if __name__ == '__main__':
+	asyncio.run(main())
@@ -0,0 +1,54 @@
+# Memoria pico al compilar un script grande leido como str contra mapeado en memoria
+# python3 benchmarks/bench_stream.py [MB] [engine]
+
+import gc
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import calc
+
+# Mostly tokens the AST doesn't keep (parentheses, numbers folded away), the
+# case where a full token list costs the most
+CHUNK = '((x1 + (42)) * ((3) - (1))) + '
+
+def compile_text(path, engine):
+	with open(path, encoding='utf-8') as f:
+		text = f.read()
+	return calc.compile_program(path, text, engine)
+
+def compile_mapped(path, engine):
+	return calc.compile_program(path, calc.map_file(path), engine)
+
+def measure(compile, path, engine):
+	gc.collect()
+	tracemalloc.start()
+	start = time.perf_counter()
+	program, error = compile(path, engine)
+	elapsed = time.perf_counter() - start
+	peak = tracemalloc.get_traced_memory()[1]
+	tracemalloc.stop()
+	if error: raise Exception(error.as_string())
+	return peak, elapsed
+
+def main():
+	size = int(float(sys.argv[1]) * 1024 * 1024) if len(sys.argv) > 1 else 1024 * 1024
+	engine = sys.argv[2] if len(sys.argv) > 2 else 'vm'
+
+	with tempfile.TemporaryDirectory() as directory:
+		path = os.path.join(directory, 'big.calc')
+		with open(path, 'w', encoding='utf-8') as f:
+			f.write(CHUNK * (size // len(CHUNK)) + '0')
+
+		print(f'{os.path.getsize(path) / 1024 / 1024:.1f} MB script, {engine} engine')
+		print(f'{"":<10}{"peak heap":>12}{"time":>10}')
+		for name, compile in (('str', compile_text), ('mmap', compile_mapped)):
+			peak, elapsed = measure(compile, path, engine)
+			print(f'{name:<10}{peak / 1024 / 1024:>10.1f}MB{elapsed:>9.2f}s')
+
+if __name__ == '__main__':
+	main()
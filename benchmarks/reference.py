@@ -0,0 +1,20 @@
+# Carga calc.py tal como estaba en otra revision de git, para comparar contra ella
+
+import os
+import subprocess
+import types
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+
+def git(*args):
+	return subprocess.check_output(['git', *args], cwd=ROOT, text=True)
+
+def load_calc(revision=None):
+	# By default compare against the first commit of the repository
+	revision = revision or git('rev-list', '--max-parents=0', 'HEAD').split()[0]
+	source = git('show', f'{revision}:calc.py')
+
+	module = types.ModuleType(f'calc_{revision[:8]}')
+	module.__file__ = f'calc.py@{revision}'
+	exec(compile(source, module.__file__, 'exec'), module.__dict__)
+	return module
@@ -0,0 +1,203 @@
+# Suite reproducible: cada etapa por separado (lexer, parser, interprete) y calc.run de punta a punta,
+# con calentamiento, repeticiones y estadisticas; guarda JSON y compara contra una linea base
+# python3 benchmarks/suite.py [--repeat N] [--warmup N] [--save resultados.json] [--compare base.json] [--threshold 0.1] [nombres...]
+
+import argparse
+import datetime
+import gc
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import calc
+import reference
+
+CHUNK = '(x1 + 42) * 3.14 - "hello world" >= y_2 AND IF count != 10 THEN VAR total = total ^ 2 <= 7 ELSE '
+TERM = '(x1 + 42) * 3.14 - "hello world" >= y_2 AND (IF count != 10 THEN total ^ -2 <= 7 ELSE n)'
+ELIF_CHAIN = 'IF i == 0 THEN 0 ' + ' '.join(f'ELIF i == {n} THEN {n}' for n in range(1, 20)) + ' ELSE -1'
+
+# Loops as (setup, program); the setup runs first, in a fresh session
+LOOPS = {
+	'while_count': ('VAR n = 0', 'WHILE n < 20000 THEN VAR n = n + 1'),
+	'for_arith': ('VAR total = 0', 'FOR i = 0 TO 20000 THEN VAR total = total * 0.5 + i ^ 2 - i / 3'),
+	'string_concat': ('VAR s = ""', 'FOR i = 0 TO 5000 THEN VAR s = s + "ab"'),
+	'if_elif_chain': ('VAR total = 0', f'FOR i = 0 TO 5000 THEN VAR total = total + ({ELIF_CHAIN})')
+}
+
+SHORT = ['VAR a = 7 * 2 + 1', 'IF 3 > 2 THEN 1 ELSE -1', 'FOR i = 0 TO 10 THEN VAR t = i ^ 2', '"ab" * 3', '(1 + 2) * (3 - 4) / 5'] * 200
+
+def lex(text):
+	tokens, error = calc.Lexer('<bench>', text).make_tokens()
+	if error: raise Exception(error.as_string())
+	return tokens
+
+def parse(text):
+	ast = calc.Parser(lex(text), calc.Source('<bench>', text)).parse()
+	if ast.error: raise Exception(ast.error.as_string())
+	return ast.node
+
+def check(result):
+	value, error = result
+	if error: raise Exception(error.as_string())
+	return value
+
+# Each workload prepares its input once and returns the function that is timed
+def lex_large():
+	text = CHUNK * (512 * 1024 // len(CHUNK))
+	return lambda: lex(text)
+
+def parser_workload(text):
+	def prepare():
+		tokens = lex(text)
+		source = calc.Source('<bench>', text)
+		return lambda: calc.Parser(tokens, source).parse()
+	return prepare
+
+def interpret_workload(setup, text):
+	def prepare():
+		node = calc.compile_node(parse(text), 'interpreter')
+		interpreter = calc.Interpreter()
+
+		def interpret():
+			session = calc.Session()
+			check(session.run('<setup>', setup))
+			context = calc.Context('<program>')
+			context.symbol_table = session.symbol_table
+			interpreter.visit(node, context)
+
+		# The setup is timed too, but it is a single assignment
+		return interpret
+	return prepare
+
+def run_workload(setup, text):
+	def prepare():
+		def run():
+			session = calc.Session()
+			check(session.run('<setup>', setup, cache=False))
+			check(session.run('<bench>', text, cache=False))
+		return run
+	return prepare
+
+def run_short():
+	def run():
+		session = calc.Session()
+		for text in SHORT:
+			check(session.run('<bench>', text, cache=False))
+	return run
+
+WORKLOADS = {
+	'lex/large': lex_large,
+	'parse/wide': parser_workload(' + '.join(f'x{i}' for i in range(20000))),
+	'parse/deep': parser_workload('(' * 3000 + '1' + ' + 1)' * 3000),
+	'parse/mixed': parser_workload(' OR '.join([TERM] * 1000)),
+	**{f'interpret/{name}': interpret_workload(setup, text) for name, (setup, text) in LOOPS.items()},
+	**{f'run/{name}': run_workload(setup, text) for name, (setup, text) in LOOPS.items()},
+	'run/short_programs': run_short
+}
+
+def measure(prepare, warmup, repeat):
+	timed = prepare()
+	for _ in range(warmup):
+		timed()
+
+	times = []
+	for _ in range(repeat):
+		gc.collect()
+		start = time.perf_counter()
+		timed()
+		times.append(time.perf_counter() - start)
+
+	return {
+		'times': times,
+		'min': min(times),
+		'median': statistics.median(times),
+		'mean': statistics.fmean(times),
+		'stdev': statistics.stdev(times) if len(times) > 1 else 0.0
+	}
+
+def metadata():
+	try:
+		revision = reference.git('rev-parse', 'HEAD').strip()
+		dirty = bool(reference.git('status', '--porcelain', '--', 'calc.py').strip())
+	except (OSError, subprocess.CalledProcessError):
+		revision, dirty = None, None
+
+	return {
+		'date': datetime.datetime.now().isoformat(timespec='seconds'),
+		'revision': revision,
+		'calc_modified': dirty,
+		'python': platform.python_version(),
+		'implementation': platform.python_implementation(),
+		'machine': platform.machine(),
+		'system': platform.platform()
+	}
+
+def compare(results, baseline, threshold):
+	# A benchmark regressed if its best time is more than threshold slower
+	# than the baseline's; the best of several runs is the one least thrown off
+	# by whatever else the machine was doing. Returns their names
+	regressions = []
+	print()
+	print(f'{"benchmark":<28}{"baseline":>11}{"current":>11}{"change":>9}')
+
+	for name, result in results.items():
+		if name not in baseline['results']:
+			print(f'{name:<28}{"-":>11}{result["min"] * 1000:>9.2f}ms{"new":>9}')
+			continue
+
+		old = baseline['results'][name]['min']
+		change = result['min'] / old - 1
+		flag = ''
+		if change > threshold:
+			flag = '  REGRESSION'
+			regressions.append(name)
+		elif change < -threshold:
+			flag = '  faster'
+
+		print(f'{name:<28}{old * 1000:>9.2f}ms{result["min"] * 1000:>9.2f}ms{change:>+8.1%}{flag}')
+
+	return regressions
+
+def main():
+	parser = argparse.ArgumentParser(description='calc benchmark suite')
+	parser.add_argument('names', nargs='*', help='benchmarks to run, or prefixes such as "parse/" (all by default)')
+	parser.add_argument('--repeat', type=int, default=10)
+	parser.add_argument('--warmup', type=int, default=2)
+	parser.add_argument('--save', metavar='FILE', help='write the results as JSON')
+	parser.add_argument('--compare', metavar='FILE', help='JSON results of an earlier run to compare against')
+	parser.add_argument('--threshold', type=float, default=0.1, help='slowdown of the best time that counts as a regression')
+	args = parser.parse_args()
+
+	sys.setrecursionlimit(10000)
+	selected = [name for name in WORKLOADS if not args.names or any(name.startswith(prefix) for prefix in args.names)]
+	if not selected: parser.error('no benchmark matches ' + ', '.join(args.names))
+
+	print(f'{"benchmark":<28}{"min":>11}{"median":>11}{"mean":>11}{"stdev":>9}')
+	results = {}
+	for name in selected:
+		result = results[name] = measure(WORKLOADS[name], args.warmup, args.repeat)
+		print(
+			f'{name:<28}{result["min"] * 1000:>9.2f}ms{result["median"] * 1000:>9.2f}ms{result["mean"] * 1000:>9.2f}ms'
+			f'{result["stdev"] / result["mean"]:>8.1%}'
+		)
+
+	if args.save:
+		with open(args.save, 'w') as f:
+			json.dump({'meta': metadata(), 'repeat': args.repeat, 'warmup': args.warmup, 'results': results}, f, indent=2)
+
+	if args.compare:
+		with open(args.compare) as f:
+			baseline = json.load(f)
+		regressions = compare(results, baseline, args.threshold)
+		if regressions:
+			print(f'\n{len(regressions)} regression(s) over {args.threshold:.0%}: {", ".join(regressions)}')
+			sys.exit(1)
+
+if __name__ == '__main__':
+	main()
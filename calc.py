@@ -3,7 +3,23 @@
 #Este codigo esta basado en el tutorial de CodePulse
 #https://github.com/davidcallanan/py-myopl-code/tree/master/ep9
 
+import bisect
+import gc
+import hashlib
+import marshal
+import math
+import mmap
+import os
+import re
 import string
+import sys
+import tempfile
+import threading
+from collections import OrderedDict
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from itertools import islice
+from time import perf_counter
+from types import GeneratorType
 
 DIGITS = '0123456789'
 LETTERS = string.ascii_letters
@@ -55,26 +71,70 @@ class RTError(Error):
 
 		return 'Traceback (most recent call last):\n' + result
 
+class BudgetError(RTError):
+	# A run went over one of the limits of its Budget
+	def __init__(self, pos_start, pos_end, details, context):
+		super().__init__(pos_start, pos_end, details, context)
+		self.error_name = 'Budget Exceeded'
+
+class Failure(Exception):
+	# Carries an Error out of the parser or the interpreter, so that neither
+	# has to hand one back from every step of the way
+	def __init__(self, error):
+		super().__init__(error)
+		self.error = error
+
+class GCPaused:
+	# Tokens and AST nodes never form reference cycles, so the cyclic collector
+	# has nothing to find while millions of them are being built; pausing it
+	# avoids repeatedly re-scanning everything allocated so far
+	def __enter__(self):
+		self.was_enabled = gc.isenabled()
+		gc.disable()
+		return self
+
+	def __exit__(self, *exc_info):
+		if self.was_enabled: gc.enable()
+
+class Source:
+	# text is a str, or a bytes-like buffer such as an mmap of the file, in
+	# which case offsets count bytes
+	def __init__(self, fn, text):
+		self.fn = fn
+		self.text = text
+		self.line_starts = None
+
+	def line_col(self, idx):
+		# Only needed when an error is reported, so the line index is built lazily
+		if self.line_starts is None:
+			newline = '\n' if isinstance(self.text, str) else b'\n'
+			self.line_starts = [0] + [match.end() for match in re.finditer(newline, self.text)]
+
+		ln = bisect.bisect_right(self.line_starts, min(idx, len(self.text))) - 1
+		return ln, idx - self.line_starts[ln]
+
 class Position:
-	def __init__(self, idx, ln, col, fn, ftxt):
+	__slots__ = ('idx', 'source')
+
+	def __init__(self, idx, source):
 		self.idx = idx
-		self.ln = ln
-		self.col = col
-		self.fn = fn
-		self.ftxt = ftxt
+		self.source = source
 
-	def advance(self, current_pos=None):
-		self.idx += 1
-		self.col += 1
+	@property
+	def ln(self):
+		return self.source.line_col(self.idx)[0]
 
-		if current_pos == '\n':
-			self.ln += 1
-			self.col = 0
+	@property
+	def col(self):
+		return self.source.line_col(self.idx)[1]
 
-		return self
+	@property
+	def fn(self):
+		return self.source.fn
 
-	def copy(self):
-		return Position(self.idx, self.ln, self.col, self.fn, self.ftxt)
+	@property
+	def ftxt(self):
+		return self.source.text
 
 t_INT				= 'INT'
 t_FLOAT    			= 'FLOAT'
@@ -97,7 +157,7 @@ t_LTE				= 'LTE'
 t_GTE				= 'GTE'
 t_EOF				= 'EOF'
 
-KEYWORDS = [
+KEYWORDS = {
 	'VAR',
 	'AND',
 	'OR',
@@ -109,20 +169,19 @@ KEYWORDS = [
 	'STEP',
 	'WHILE',
 	'THEN'
-]
+}
 
 class Token:
+	__slots__ = ('type', 'value', 'pos_start', 'pos_end')
+
 	def __init__(self, type_, value=None, pos_start=None, pos_end=None):
 		self.type = type_
 		self.value = value
+		self.pos_start = pos_start
+		self.pos_end = pos_end
 
-		if pos_start:
-			self.pos_start = pos_start.copy()
-			self.pos_end = pos_start.copy()
-			self.pos_end.advance()
-
-		if pos_end:
-			self.pos_end = pos_end.copy()
+		if pos_end is None and pos_start is not None:
+			self.pos_end = pos_start + 1
 
 	def matches(self, type_, value):
 		return self.type == type_ and self.value == value
@@ -131,168 +190,158 @@ class Token:
 		if self.value: return f'{self.type}:{self.value}'
 		return f'{self.type}'
 
+# Leading blanks, then exactly one of: word, number, operator, string, a lone
+# '!' or any other (illegal) character
+TOKEN_REGEX = re.compile(r'''
+	([ \t]*)
+	(?:
+		([A-Za-z][A-Za-z0-9_]*)
+		| ([0-9]+(?:\.[0-9]*)?)
+		| ([-+*/^()]|[=<>]=?|!=)
+		| ("[^"]*"?)
+		| (!)
+		| (.)
+	)?
+''', re.VERBOSE | re.DOTALL)
+
+# The same, to scan a file's bytes in place
+TOKEN_REGEX_BYTES = re.compile(TOKEN_REGEX.pattern.encode(), re.VERBOSE | re.DOTALL)
+
+OPERATORS = {
+	'+': t_PLUS,
+	'-': t_MINUS,
+	'*': t_MUL,
+	'/': t_DIV,
+	'^': t_POW,
+	'(': t_LPAREN,
+	')': t_RPAREN,
+	'=': t_EQ,
+	'==': t_EE,
+	'!=': t_NE,
+	'<': t_LT,
+	'>': t_GT,
+	'<=': t_LTE,
+	'>=': t_GTE
+}
+
 class Lexer:
+	# Scans the whole text with one master regex. Tokens only hold offsets into
+	# the text; line and column are worked out from the Source for errors
 	def __init__(self, fn, text):
 		self.fn = fn
 		self.text = text
-		self.pos = Position(-1, 0, -1, fn, text)
-		self.current_pos = None
-		self.advance()
-	
-	def advance(self):
-		self.pos.advance(self.current_pos)
-		self.current_pos = self.text[self.pos.idx] if self.pos.idx < len(self.text) else None
+		self.source = Source(fn, text)
+		self.error = None
 
 	def make_tokens(self):
-		tokens = []
+		with GCPaused():
+			return self.scan_tokens()
 
-		while self.current_pos != None:
-			if self.current_pos in ' \t':
-				self.advance()
-			elif self.current_pos in DIGITS:
-				tokens.append(self.is_number())
-			elif self.current_pos in LETTERS:
-				tokens.append(self.is_identifier())
-			elif self.current_pos == '"':
-				tokens.append(self.is_string())
-			elif self.current_pos == '+':
-				tokens.append(Token(t_PLUS, pos_start=self.pos))
-				self.advance()
-			elif self.current_pos == '-':
-				tokens.append(Token(t_MINUS, pos_start=self.pos))
-				self.advance()
-			elif self.current_pos == '*':
-				tokens.append(Token(t_MUL, pos_start=self.pos))
-				self.advance()
-			elif self.current_pos == '/':
-				tokens.append(Token(t_DIV, pos_start=self.pos))
-				self.advance()
-			elif self.current_pos == '^':
-				tokens.append(Token(t_POW, pos_start=self.pos))
-				self.advance()
-			elif self.current_pos == '(':
-				tokens.append(Token(t_LPAREN, pos_start=self.pos))
-				self.advance()
-			elif self.current_pos == ')':
-				tokens.append(Token(t_RPAREN, pos_start=self.pos))
-				self.advance()
-			elif self.current_pos == '!':
-				token, error = self.is_not_equal()
-				if error: return [], error
-				tokens.append(token)
-			elif self.current_pos == '=':
-				tokens.append(self.is_equal())
-			elif self.current_pos == '<':
-				tokens.append(self.is_less_than())
-			elif self.current_pos == '>':
-				tokens.append(self.is_greater_than())
+	def scan_tokens(self):
+		tokens = []
+		append = tokens.append
+		source = self.source
+		idx = 0
+
+		for blanks, word, number, operator, string, bang, char in TOKEN_REGEX.findall(self.text):
+			idx += len(blanks)
+
+			if word:
+				end = idx + len(word)
+				tok_type = t_KEYWORD if word in KEYWORDS else t_IDENTIFIER
+				append(Token(tok_type, word, idx, end))
+			elif operator:
+				end = idx + len(operator)
+				append(Token(OPERATORS[operator], None, idx, end))
+			elif number:
+				end = idx + len(number)
+				if '.' in number:
+					append(Token(t_FLOAT, float(number), idx, end))
+				else:
+					append(Token(t_INT, int(number), idx, end))
+			elif string:
+				token = self.make_string(string, idx)
+				append(token)
+				end = token.pos_end
+			elif bang:
+				return [], ExpectedCharError(Position(idx, source), Position(idx + 2, source), "'=' (after '!')")
+			elif char:
+				return [], IllegalCharError(Position(idx, source), Position(idx + 1, source), "'" + char + "'")
 			else:
-				pos_start = self.pos.copy()
-				char = self.current_pos
-				self.advance()
-				return [], IllegalCharError(pos_start, self.pos, "'" + char + "'")
-
-		tokens.append(Token(t_EOF, pos_start=self.pos))
-		return tokens, None
-
-	def is_number(self):
-		num_str = ''
-		dot_count = 0
-		pos_start = self.pos.copy()
+				# Trailing blanks
+				end = idx
 
-		while self.current_pos != None and self.current_pos in DIGITS + '.':
-			if self.current_pos == '.':
-				if dot_count == 1: break
-				dot_count += 1
-			num_str += self.current_pos
-			self.advance()
+			idx = end
 
-		if dot_count == 0:
-			return Token(t_INT, int(num_str), pos_start, self.pos)
-		else:
-			return Token(t_FLOAT, float(num_str), pos_start, self.pos)
-
-	def is_string(self):
-		string = ''
-		pos_start = self.pos.copy()
-		escape_char = False
-		self.advance()
-
-		escape_chars = {
-			'n': '\n',
-			't': '\t'
-		}
+		append(Token(t_EOF, pos_start=idx))
+		return tokens, None
 
-		while self.current_pos != None and (self.current_pos != '"' or escape_char):
-			if escape_char:
-				string += escape_chars.get(self.current_pos, self.current_pos)
-			else:
-				if self.current_pos == '\\':
-					escape_char = True
+	def iter_tokens(self, start=0):
+		# The tokens of make_tokens, made one at a time as the parser asks for
+		# them, so no list of them (nor, for a mapped file, the text) is ever
+		# held in memory. Values are sliced from the buffer as it is scanned.
+		# A lexing error ends the tokens with EOF and is left in self.error.
+		# start must be 0 or where a token ended
+		text = self.text
+		binary = not isinstance(text, str)
+		source = self.source
+		idx = start
+
+		for match in (TOKEN_REGEX_BYTES if binary else TOKEN_REGEX).finditer(text, start):
+			blanks, word, number, operator, string, bang, char = match.groups()
+			idx += len(blanks)
+
+			if word:
+				end = idx + len(word)
+				if binary: word = word.decode()
+				yield Token(t_KEYWORD if word in KEYWORDS else t_IDENTIFIER, word, idx, end)
+			elif operator:
+				end = idx + len(operator)
+				yield Token(OPERATORS[operator.decode() if binary else operator], None, idx, end)
+			elif number:
+				end = idx + len(number)
+				if b'.' in number if binary else '.' in number:
+					yield Token(t_FLOAT, float(number), idx, end)
 				else:
-					string += self.current_pos
-			self.advance()
-			escape_char = False
-		
-		self.advance()
-		return Token(t_STRING, string, pos_start, self.pos)
-
-	def is_identifier(self):
-		id_str = ''
-		pos_start = self.pos.copy()
-
-		while self.current_pos != None and self.current_pos in LETTERS_DIGITS + '_':
-			id_str += self.current_pos
-			self.advance()
-
-		tok_type = t_KEYWORD if id_str in KEYWORDS else t_IDENTIFIER
-		return Token(tok_type, id_str, pos_start, self.pos)
-
-	def is_not_equal(self):
-		pos_start = self.pos.copy()
-		self.advance()
-
-		if self.current_pos == '=':
-			self.advance()
-			return Token(t_NE, pos_start=pos_start, pos_end=self.pos), None
-
-		self.advance()
-		return None, ExpectedCharError(pos_start, self.pos, "'=' (after '!')")
-	
-	def is_equal(self):
-		tok_type = t_EQ
-		pos_start = self.pos.copy()
-		self.advance()
-
-		if self.current_pos == '=':
-			self.advance()
-			tok_type = t_EE
-
-		return Token(tok_type, pos_start=pos_start, pos_end=self.pos)
-
-	def is_less_than(self):
-		tok_type = t_LT
-		pos_start = self.pos.copy()
-		self.advance()
-
-		if self.current_pos == '=':
-			self.advance()
-			tok_type = t_LTE
+					yield Token(t_INT, int(number), idx, end)
+			elif string:
+				if binary:
+					decoded = string.decode('utf-8', 'surrogateescape')
+					token = self.make_string(decoded, idx)
+					# Offsets count bytes in a buffer
+					token.pos_end += len(string) - len(decoded)
+				else:
+					token = self.make_string(string, idx)
+				yield token
+				end = token.pos_end
+			elif bang:
+				self.error = ExpectedCharError(Position(idx, source), Position(idx + 2, source), "'=' (after '!')")
+				break
+			elif char:
+				if binary: char = bytes(text[idx:idx + 4]).decode('utf-8', 'ignore')[:1] or char.decode('latin-1')
+				self.error = IllegalCharError(Position(idx, source), Position(idx + 1, source), "'" + char + "'")
+				break
+			else:
+				# Trailing blanks
+				end = idx
 
-		return Token(tok_type, pos_start=pos_start, pos_end=self.pos)
+			idx = end
 
-	def is_greater_than(self):
-		tok_type = t_GT
-		pos_start = self.pos.copy()
-		self.advance()
+		yield Token(t_EOF, pos_start=idx)
 
-		if self.current_pos == '=':
-			self.advance()
-			tok_type = t_GTE
+	def make_string(self, text, idx):
+		# Backslashes are dropped and never escape anything, as in the original
+		# character-by-character lexer. An unterminated string runs one past the end.
+		if len(text) > 1 and text[-1] == '"':
+			string, end = text[1:-1], idx + len(text)
+		else:
+			string, end = text[1:], idx + len(text) + 1
 
-		return Token(tok_type, pos_start=pos_start, pos_end=self.pos)
+		return Token(t_STRING, string.replace('\\', ''), idx, end)
 
 class NumberNode:
+	__slots__ = ('tok', 'pos_start', 'pos_end')
+
 	def __init__(self, tok):
 		self.tok = tok
 
@@ -303,6 +352,8 @@ class NumberNode:
 		return f'{self.tok}'
 
 class StringNode:
+	__slots__ = ('tok', 'pos_start', 'pos_end')
+
 	def __init__(self, tok):
 		self.tok = tok
 
@@ -313,21 +364,29 @@ class StringNode:
 		return f'{self.tok}'
 
 class VarAccessNode:
+	__slots__ = ('var_name_tok', 'slot', 'pos_start', 'pos_end')
+
 	def __init__(self, var_name_tok):
 		self.var_name_tok = var_name_tok
+		self.slot = None
 
 		self.pos_start = self.var_name_tok.pos_start
 		self.pos_end = self.var_name_tok.pos_end
 
 class VarAssignNode:
+	__slots__ = ('var_name_tok', 'value_node', 'slot', 'pos_start', 'pos_end')
+
 	def __init__(self, var_name_tok, value_node):
 		self.var_name_tok = var_name_tok
 		self.value_node = value_node
+		self.slot = None
 
 		self.pos_start = self.var_name_tok.pos_start
 		self.pos_end = self.value_node.pos_end
 
 class BinOpNode:
+	__slots__ = ('left_node', 'op_tok', 'right_node', 'pos_start', 'pos_end')
+
 	def __init__(self, left_node, op_tok, right_node):
 		self.left_node = left_node
 		self.op_tok = op_tok
@@ -340,6 +399,8 @@ class BinOpNode:
 		return f'({self.left_node}, {self.op_tok}, {self.right_node})'
 
 class UnaryOpNode:
+	__slots__ = ('op_tok', 'node', 'pos_start', 'pos_end')
+
 	def __init__(self, op_tok, node):
 		self.op_tok = op_tok
 		self.node = node
@@ -351,6 +412,8 @@ class UnaryOpNode:
 		return f'({self.op_tok}, {self.node})'
 
 class IfNode:
+	__slots__ = ('cases', 'else_case', 'pos_start', 'pos_end')
+
 	def __init__(self, cases, else_case):
 		self.cases = cases
 		self.else_case = else_case
@@ -359,17 +422,22 @@ class IfNode:
 		self.pos_end = (self.else_case or self.cases[len(self.cases) - 1][0]).pos_end
 
 class ForNode:
+	__slots__ = ('var_name_tok', 'start_value_node', 'end_value_node', 'step_value_node', 'body_node', 'slot', 'pos_start', 'pos_end')
+
 	def __init__(self, var_name_tok, start_value_node, end_value_node, step_value_node, body_node):
 		self.var_name_tok = var_name_tok
 		self.start_value_node = start_value_node
 		self.end_value_node = end_value_node
 		self.step_value_node = step_value_node
 		self.body_node = body_node
+		self.slot = None
 
 		self.pos_start = self.var_name_tok.pos_start
 		self.pos_end = self.body_node.pos_end
 
 class WhileNode:
+	__slots__ = ('condition_node', 'body_node', 'pos_start', 'pos_end')
+
 	def __init__(self, condition_node, body_node):
 		self.condition_node = condition_node
 		self.body_node = body_node
@@ -377,23 +445,26 @@ class WhileNode:
 		self.pos_start = self.condition_node.pos_start
 		self.pos_end = self.body_node.pos_end
 
+class ProgramNode:
+	# Root of a resolved program; the variable in slot i is names[i]
+	__slots__ = ('body_node', 'names', 'pos_start', 'pos_end')
+
+	def __init__(self, body_node, names):
+		self.body_node = body_node
+		self.names = names
+
+		self.pos_start = self.body_node.pos_start
+		self.pos_end = self.body_node.pos_end
+
 class ParseResult:
+	__slots__ = ('error', 'node', 'last_registered_advance_count', 'advance_count')
+
 	def __init__(self):
 		self.error = None
 		self.node = None
 		self.last_registered_advance_count = 0
 		self.advance_count = 0
 
-	def register_advancement(self):
-		self.last_registered_advance_count = 1
-		self.advance_count += 1
-
-	def register(self, res):
-		self.last_registered_advance_count = res.advance_count
-		self.advance_count += res.advance_count
-		if res.error: self.error = res.error
-		return res.node
-
 	def success(self, node):
 		self.node = node
 		return self
@@ -403,396 +474,723 @@ class ParseResult:
 			self.error = error
 		return self
 
+# Binding power of each binary operator; equal levels associate to the left.
+# '^' binds tighter than any of these and than the unary signs, and is
+# handled with them: it associates to the right and allows '2 ^ -1', and
+# '-2 ^ 2' is -(2 ^ 2)
+LEVEL_LOGIC		= 1
+LEVEL_COMPARE	= 2
+LEVEL_ARITH		= 3
+LEVEL_TERM		= 4
+
+BINARY_LEVELS = {
+	(t_KEYWORD, 'AND'): LEVEL_LOGIC,
+	(t_KEYWORD, 'OR'): LEVEL_LOGIC,
+	t_EE: LEVEL_COMPARE,
+	t_NE: LEVEL_COMPARE,
+	t_LT: LEVEL_COMPARE,
+	t_GT: LEVEL_COMPARE,
+	t_LTE: LEVEL_COMPARE,
+	t_GTE: LEVEL_COMPARE,
+	t_PLUS: LEVEL_ARITH,
+	t_MINUS: LEVEL_ARITH,
+	t_MUL: LEVEL_TERM,
+	t_DIV: LEVEL_TERM
+}
+
+# Frames on the parser's work stack, one per construct still waiting for a
+# sub-expression. Stages say which part of an IF, FOR, unary, ... comes next
+P_EXPR			= 0		# [P_EXPR, start index]
+P_ASSIGN		= 1		# [P_ASSIGN, var name token]
+P_BINARY		= 2		# [P_BINARY, operands, operators, level of pending operator, right operand start index]
+P_UNARY			= 3		# [P_UNARY, stage, signs, node, operator token or arguments start index]
+P_PAREN			= 4		# [P_PAREN]
+P_IF			= 5		# [P_IF, stage, cases, condition]
+P_FOR			= 6		# [P_FOR, stage, var name token, start, end, step]
+P_WHILE			= 7		# [P_WHILE, stage, condition]
+
+S_ATOM			= 0
+S_ARGS			= 1
+S_POW			= 2
+S_CONDITION		= 3
+S_THEN			= 4
+S_ELSE			= 5
+S_START			= 6
+S_END			= 7
+S_STEP			= 8
+S_BODY			= 9
+
+# What the parser does next: start an expression, start a unary expression,
+# or hand a finished node to the frame on top
+M_EXPR			= 0
+M_UNARY			= 1
+M_RESULT		= 2
+
 class Parser:
-	def __init__(self, tokens):
-		self.tokens = tokens
+	# Parses with an explicit stack of frames instead of one Python call per
+	# grammar rule, so nesting depth is only limited by memory. Operator
+	# expressions use an operator stack over BINARY_LEVELS. Errors are the
+	# ones the old recursive grammar gave: an expression that fails before
+	# consuming any token reports what an expression may start with, and so
+	# do a comparison right after AND/OR and the arguments of a call. Tokens
+	# are pulled from any iterable ending in EOF (a list, or
+	# Lexer.iter_tokens) one ahead of the current one; tok_idx counts them.
+	# Given a units list, every expression parsed on its own (the program, an
+	# IF condition or branch, a FOR body, what is inside parentheses, ...) is
+	# added to it as (start index, end index, node)
+	def __init__(self, tokens, source, units=None):
+		self.tokens = iter(tokens)
+		self.source = source
+		self.units = units
 		self.tok_idx = -1
+		self.next_tok = next(self.tokens)
 		self.advance()
 
 	def advance(self, ):
 		self.tok_idx += 1
-		if self.tok_idx < len(self.tokens):
-			self.current_tok = self.tokens[self.tok_idx]
-		return self.current_tok
+		tok = self.current_tok = self.next_tok
+		if tok.type != t_EOF:
+			self.next_tok = next(self.tokens)
+		return tok
+
+	def syntax_error(self, details):
+		return InvalidSyntaxError(
+			Position(self.current_tok.pos_start, self.source), Position(self.current_tok.pos_end, self.source),
+			details
+		)
 
 	def parse(self):
-		res = self.expr()
-		if not res.error and self.current_tok.type != t_EOF:
-			return res.failure(InvalidSyntaxError(
-				self.current_tok.pos_start, self.current_tok.pos_end,
-				"Expected '+', '-', '*', '/', '^', '==', '!=', '<', '>', <=', '>=', 'AND' or 'OR'"
-			))
-		return res
-
-	def expr(self):
 		res = ParseResult()
-
-		if self.current_tok.matches(t_KEYWORD, 'VAR'):
-			res.register_advancement()
-			self.advance()
-
-			if self.current_tok.type != t_IDENTIFIER:
-				return res.failure(InvalidSyntaxError(
-					self.current_tok.pos_start, self.current_tok.pos_end,
-					"Expected identifier"
-				))
-
-			var_name = self.current_tok
-			res.register_advancement()
-			self.advance()
-
-			if self.current_tok.type != t_EQ:
-				return res.failure(InvalidSyntaxError(
-					self.current_tok.pos_start, self.current_tok.pos_end,
-					"Expected '='"
-				))
-
-			res.register_advancement()
-			self.advance()
-			expr = res.register(self.expr())
-			if res.error: return res
-			return res.success(VarAssignNode(var_name, expr))
-
-		node = res.register(self.bin_op(self.comp_expr, ((t_KEYWORD, 'AND'), (t_KEYWORD, 'OR'))))
-
-		if res.error:
-			return res.failure(InvalidSyntaxError(
-				self.current_tok.pos_start, self.current_tok.pos_end,
-				"Expected 'VAR', 'IF', 'FOR', 'WHILE', int, float, identifier, '+', '-', '('"
-			))
-
-		return res.success(node)
-
-	def comp_expr(self):
-		res = ParseResult()
-		node = res.register(self.bin_op(self.arith_expr, (t_EE, t_NE, t_LT, t_GT, t_LTE, t_GTE)))
-		
-		if res.error:
-			return res.failure(InvalidSyntaxError(
-				self.current_tok.pos_start, self.current_tok.pos_end,
-				"Expected int, float, identifier, '+', '-', '(''"
+		try:
+			with GCPaused():
+				node = self.expr()
+		except Failure as failure:
+			return res.failure(failure.error)
+
+		if self.current_tok.type != t_EOF:
+			return res.failure(self.syntax_error(
+				"Expected '+', '-', '*', '/', '^', '==', '!=', '<', '>', <=', '>=', 'AND' or 'OR'"
 			))
 
 		return res.success(node)
 
-	def arith_expr(self):
-		return self.bin_op(self.term, (t_PLUS, t_MINUS))
-
-	def term(self):
-		return self.bin_op(self.factor, (t_MUL, t_DIV))
-
-	def factor(self):
-		res = ParseResult()
-		tok = self.current_tok
-
-		if tok.type in (t_PLUS, t_MINUS):
-			res.register_advancement()
-			self.advance()
-			factor = res.register(self.factor())
-			if res.error: return res
-			return res.success(UnaryOpNode(tok, factor))
-
-		return self.power()
-
-	def power(self):
-		return self.bin_op(self.call, (t_POW, ), self.factor)
+	def expr(self, mode=M_EXPR):
+		# Returns the node, or raises a Failure. With M_UNARY, parses a single operand
+		stack = []
+		push = stack.append
+		node = None
+
+		try:
+			while True:
+				if mode == M_EXPR:
+					tok = self.current_tok
+
+					if tok.type == t_KEYWORD and tok.value == 'VAR':
+						self.advance()
+
+						if self.current_tok.type != t_IDENTIFIER:
+							raise Failure(self.syntax_error("Expected identifier"))
+
+						var_name = self.current_tok
+						self.advance()
+
+						if self.current_tok.type != t_EQ:
+							raise Failure(self.syntax_error("Expected '='"))
+
+						self.advance()
+						push([P_ASSIGN, var_name])
+						continue
+
+					push([P_EXPR, self.tok_idx])
+					push([P_BINARY, None, None, 0, 0])
+					mode = M_UNARY
+
+				if mode == M_UNARY:
+					tok = self.current_tok
+					signs = None
+
+					if tok.type in (t_PLUS, t_MINUS):
+						signs = []
+						while tok.type in (t_PLUS, t_MINUS):
+							signs.append(tok)
+							tok = self.advance()
+
+					if tok.type in (t_INT, t_FLOAT, t_IDENTIFIER, t_STRING):
+						self.advance()
+						if tok.type == t_IDENTIFIER: node = VarAccessNode(tok)
+						elif tok.type == t_STRING: node = StringNode(tok)
+						else: node = NumberNode(tok)
+
+						if signs or self.current_tok.type in (t_LPAREN, t_POW):
+							push([P_UNARY, S_ATOM, signs, None, None])
+						mode = M_RESULT
+
+					elif tok.type == t_LPAREN:
+						self.advance()
+						push([P_UNARY, S_ATOM, signs, None, None])
+						push([P_PAREN])
+						mode = M_EXPR
+						continue
+
+					elif tok.matches(t_KEYWORD, 'IF'):
+						self.advance()
+						push([P_UNARY, S_ATOM, signs, None, None])
+						push([P_IF, S_CONDITION, [], None])
+						mode = M_EXPR
+						continue
+
+					elif tok.matches(t_KEYWORD, 'FOR'):
+						self.advance()
+						push([P_UNARY, S_ATOM, signs, None, None])
+
+						if self.current_tok.type != t_IDENTIFIER:
+							raise Failure(self.syntax_error("Expected identifier"))
+
+						var_name = self.current_tok
+						self.advance()
+
+						if self.current_tok.type != t_EQ:
+							raise Failure(self.syntax_error("Expected '='"))
+
+						self.advance()
+						push([P_FOR, S_START, var_name, None, None, None])
+						mode = M_EXPR
+						continue
+
+					elif tok.matches(t_KEYWORD, 'WHILE'):
+						self.advance()
+						push([P_UNARY, S_ATOM, signs, None, None])
+						push([P_WHILE, S_CONDITION, None])
+						mode = M_EXPR
+						continue
+
+					else:
+						raise Failure(self.syntax_error("Expected int, float, identifier, '+', '-', '(', 'IF', 'FOR', 'WHILE'"))
+
+				if mode == M_RESULT:
+					if not stack: return node
+					frame = stack[-1]
+					kind = frame[0]
+
+					if kind == P_BINARY:
+						operands = frame[1]
+						op_tok = self.current_tok
+						level = BINARY_LEVELS.get(op_tok.type) or BINARY_LEVELS.get((op_tok.type, op_tok.value))
+
+						if operands is None:
+							if not level:
+								# A lone operand, by far the most common case
+								stack.pop()
+								continue
+							operands = frame[1] = [node]
+							operators = frame[2] = []
+						else:
+							operands.append(node)
+							operators = frame[2]
+
+						while level:
+							while operators and operators[-1][0] >= level:
+								right = operands.pop()
+								operands[-1] = BinOpNode(operands[-1], operators.pop()[1], right)
+							operators.append((level, op_tok))
+
+							tok = self.advance()
+							# A plain number or name needs none of the unary checks
+							if tok.type in (t_INT, t_FLOAT, t_IDENTIFIER) and self.next_tok.type not in (t_LPAREN, t_POW):
+								self.advance()
+								operands.append(NumberNode(tok) if tok.type != t_IDENTIFIER else VarAccessNode(tok))
+								op_tok = self.current_tok
+								level = BINARY_LEVELS.get(op_tok.type) or BINARY_LEVELS.get((op_tok.type, op_tok.value))
+								continue
+
+							frame[3] = level
+							frame[4] = self.tok_idx
+							break
+
+						if level:
+							mode = M_UNARY
+							continue
+
+						while operators:
+							right = operands.pop()
+							operands[-1] = BinOpNode(operands[-1], operators.pop()[1], right)
+
+						stack.pop()
+						node = operands[0]
+
+					elif kind == P_EXPR:
+						stack.pop()
+						if self.units is not None: self.units.append((frame[1], self.tok_idx, node))
+
+					elif kind == P_UNARY:
+						stage = frame[1]
+
+						if stage == S_POW:
+							node = BinOpNode(frame[3], frame[4], node)
+
+						else:
+							if stage == S_ATOM:
+								frame[3] = node
+
+								if self.current_tok.type == t_LPAREN:
+									# Arguments are parsed and checked but not kept
+									self.advance()
+
+									if self.current_tok.type != t_RPAREN:
+										frame[1] = S_ARGS
+										frame[4] = self.tok_idx
+										mode = M_EXPR
+										continue
+
+									self.advance()
+
+							elif stage == S_ARGS:
+								if self.current_tok.type != t_RPAREN:
+									stack.pop()
+									raise Failure(self.syntax_error("Expected ',' or ')'"))
+
+								self.advance()
+
+							node = frame[3]
+
+							if self.current_tok.type == t_POW:
+								frame[1] = S_POW
+								frame[4] = self.current_tok
+								self.advance()
+								mode = M_UNARY
+								continue
+
+						stack.pop()
+						if frame[2]:
+							for sign in reversed(frame[2]):
+								node = UnaryOpNode(sign, node)
+
+					elif kind == P_ASSIGN:
+						stack.pop()
+						node = VarAssignNode(frame[1], node)
+
+					elif kind == P_PAREN:
+						stack.pop()
+
+						if self.current_tok.type != t_RPAREN:
+							raise Failure(self.syntax_error("Expected ')'"))
+
+						self.advance()
+
+					elif kind == P_IF:
+						stage = frame[1]
+
+						if stage == S_CONDITION:
+							if not self.current_tok.matches(t_KEYWORD, 'THEN'):
+								stack.pop()
+								raise Failure(self.syntax_error("Expected 'THEN'"))
+
+							self.advance()
+							frame[1] = S_THEN
+							frame[3] = node
+							mode = M_EXPR
+							continue
+
+						if stage == S_THEN:
+							frame[2].append((frame[3], node))
+
+							if self.current_tok.matches(t_KEYWORD, 'ELIF'):
+								self.advance()
+								frame[1] = S_CONDITION
+								mode = M_EXPR
+								continue
+
+							if self.current_tok.matches(t_KEYWORD, 'ELSE'):
+								self.advance()
+								frame[1] = S_ELSE
+								mode = M_EXPR
+								continue
+
+							node = None
+
+						stack.pop()
+						node = IfNode(frame[2], node)
+
+					elif kind == P_FOR:
+						stage = frame[1]
+
+						if stage == S_START:
+							if not self.current_tok.matches(t_KEYWORD, 'TO'):
+								stack.pop()
+								raise Failure(self.syntax_error("Expected 'TO'"))
+
+							self.advance()
+							frame[1] = S_END
+							frame[3] = node
+							mode = M_EXPR
+							continue
+
+						if stage == S_END:
+							frame[4] = node
+
+							if self.current_tok.matches(t_KEYWORD, 'STEP'):
+								self.advance()
+								frame[1] = S_STEP
+								mode = M_EXPR
+								continue
+
+						elif stage == S_STEP:
+							frame[5] = node
+
+						if stage != S_BODY:
+							if not self.current_tok.matches(t_KEYWORD, 'THEN'):
+								stack.pop()
+								raise Failure(self.syntax_error("Expected 'THEN'"))
+
+							self.advance()
+							frame[1] = S_BODY
+							mode = M_EXPR
+							continue
+
+						stack.pop()
+						node = ForNode(frame[2], frame[3], frame[4], frame[5], node)
+
+					elif kind == P_WHILE:
+						if frame[1] == S_CONDITION:
+							if not self.current_tok.matches(t_KEYWORD, 'THEN'):
+								stack.pop()
+								raise Failure(self.syntax_error("Expected 'THEN'"))
+
+							self.advance()
+							frame[1] = S_BODY
+							frame[2] = node
+							mode = M_EXPR
+							continue
+
+						stack.pop()
+						node = WhileNode(frame[2], node)
+
+					continue
+		except Failure as failure:
+			# Hand the error down the stack. A frame whose sub-expression failed
+			# without consuming a token may replace it with what it expected there
+			while stack:
+				frame = stack.pop()
+				kind = frame[0]
+
+				if kind == P_EXPR:
+					if self.tok_idx == frame[1]:
+						failure.error = self.syntax_error(
+							"Expected 'VAR', 'IF', 'FOR', 'WHILE', int, float, identifier, '+', '-', '('"
+						)
+				elif kind == P_BINARY:
+					if frame[3] == LEVEL_LOGIC and self.tok_idx == frame[4]:
+						failure.error = self.syntax_error("Expected int, float, identifier, '+', '-', '(''")
+				elif kind == P_UNARY:
+					if frame[1] == S_ARGS and self.tok_idx == frame[4]:
+						failure.error = self.syntax_error(
+							"Expected ')', 'VAR', 'IF', 'FOR', 'WHILE', int, float, identifier, '+', '-', '('"
+						)
+
+			raise
+
+# Fields of each node that hold other nodes; an IfNode's are in its cases
+CHILD_FIELDS = {
+	VarAssignNode: ('value_node',),
+	BinOpNode: ('left_node', 'right_node'),
+	UnaryOpNode: ('node',),
+	ForNode: ('start_value_node', 'end_value_node', 'step_value_node', 'body_node'),
+	WhileNode: ('condition_node', 'body_node')
+}
+
+def child_nodes(node):
+	if type(node) is IfNode:
+		for condition, expr in node.cases:
+			yield condition
+			yield expr
+		if node.else_case: yield node.else_case
+		return
+
+	for field in CHILD_FIELDS.get(type(node), ()):
+		child = getattr(node, field)
+		if child: yield child
+
+def token_start(tok):
+	return tok.pos_start
+
+def token_end(tok):
+	return tok.pos_end
+
+class IncrementalParser:
+	# The tokens and AST of a text being edited. edit() re-lexes from the last
+	# token that ends before the change until a new token ends where an old one
+	# did, then re-parses only the smallest expression around the changed
+	# tokens (an IF branch, a FOR body, what is inside parentheses, ...) and
+	# keeps it if it stops at the same token the old one did. Tokens and nodes
+	# after the change are shifted in place. Anything else falls back to
+	# lexing and parsing the whole text, so node and error are always what
+	# Lexer and Parser would give for it
+	def __init__(self, fn, text):
+		self.fn = fn
+		self.parse_all(text)
 
-	def call(self):
-		res = ParseResult()
-		atom = res.register(self.atom())
-		if res.error: return res
+	def parse_all(self, text):
+		lexer = Lexer(self.fn, text)
+		self.text = text
+		self.source = lexer.source
+		self.units = []
+		self.tokens, error = lexer.make_tokens()
+		self.node = None
 
-		if self.current_tok.type == t_LPAREN:
-			res.register_advancement()
-			self.advance()
-			arg_nodes = []
+		if not error:
+			ast = Parser(self.tokens, self.source, self.units).parse()
+			self.node, error = ast.node, ast.error
 
-			if self.current_tok.type == t_RPAREN:
-				res.register_advancement()
-				self.advance()
+		self.error = error
+		return self.node, error
+
+	def edit(self, offset, removed, inserted):
+		# Replaces text[offset:offset + removed] with inserted; returns (node, error)
+		with GCPaused():
+			text = self.text[:offset] + inserted + self.text[offset + removed:]
+			if self.error: return self.parse_all(text)
+
+			tokens = self.tokens
+			eof = len(tokens) - 1
+			delta = len(inserted) - removed
+			# Lex again from the end of the last token before the change until a
+			# new token ends where an old one did past it; from there on the old
+			# tokens are still right, moved by delta
+			first = bisect.bisect_left(tokens, offset, 0, eof, key=token_end)
+			lexer = Lexer(self.fn, text)
+			new_tokens = []
+			last = eof
+
+			for tok in lexer.iter_tokens(tokens[first - 1].pos_end if first else 0):
+				if tok.type == t_EOF:
+					if tok.pos_start != tokens[eof].pos_start + delta:
+						new_tokens.append(tok)
+						last = eof + 1
+					break
+
+				new_tokens.append(tok)
+				if tok.pos_end >= offset + len(inserted):
+					old = bisect.bisect_left(tokens, tok.pos_end - delta, first, eof, key=token_end)
+					if old < eof and tokens[old].pos_end == tok.pos_end - delta:
+						last = old + 1
+						break
+
+			self.text = text
+			self.source = lexer.source
+			if lexer.error:
+				self.node, self.error = None, lexer.error
+				return None, lexer.error
+
+			changed = tokens[first].pos_start
+			for i in range(last, eof + 1):
+				tok = tokens[i]
+				tok.pos_start += delta
+				tok.pos_end += delta
+			tokens[first:last] = new_tokens
+
+			stop = first + len(new_tokens)
+			count = stop - last
+			# Smallest expressions around the changed tokens first
+			units = sorted((unit for unit in self.units if unit[0] <= first and last <= unit[1]), key=lambda unit: unit[1] - unit[0])
+
+			for start, end, old_node in units:
+				span = self.operand(start, end + count, old_node, first, stop)
+				if span and self.reparse(*span, M_UNARY, first, changed, count, delta): return self.node, None
+				if self.reparse(start, end + count, old_node, M_EXPR, first, changed, count, delta): return self.node, None
+
+			return self.parse_all(text)
+
+	def operand(self, start, end, node, first, stop):
+		# The operand holding the changed tokens [first, stop) when node, parsed
+		# from start to end, is a chain of binary operators ('a + b * c ...').
+		# The operators around it decide how the chain is put together, so if
+		# they are untouched the operand can be parsed again on its own
+		if first == stop: return None
+		tokens = self.tokens
+		change_start = tokens[first].pos_start
+		change_end = tokens[stop - 1].pos_end
+		before = after = inner = None
+
+		while type(node) is BinOpNode and node.op_tok.type != t_POW:
+			# Not what is inside parentheses, which is a chain of its own
+			if inner is None: inner = {id(unit_node) for unit_start, _, unit_node in self.units if unit_start > start}
+			if id(node) in inner: break
+
+			if node.op_tok.pos_end <= change_start:
+				before, node = node.op_tok, node.right_node
+			elif node.op_tok.pos_start >= change_end:
+				after, node = node.op_tok, node.left_node
 			else:
-				arg_nodes.append(res.register(self.expr()))
-				if res.error:
-					return res.failure(InvalidSyntaxError(
-						self.current_tok.pos_start, self.current_tok.pos_end,
-						"Expected ')', 'VAR', 'IF', 'FOR', 'WHILE', int, float, identifier, '+', '-', '('"
-					))
-
-				if self.current_tok.type != t_RPAREN:
-					return res.failure(InvalidSyntaxError(
-						self.current_tok.pos_start, self.current_tok.pos_end,
-						f"Expected ',' or ')'"
-					))
-
-				res.register_advancement()
-				self.advance()
-
-		return res.success(atom)
-
-	def atom(self):
-		res = ParseResult()
-		tok = self.current_tok
-
-		if tok.type in (t_INT, t_FLOAT):
-			res.register_advancement()
-			self.advance()
-			return res.success(NumberNode(tok))
-
-		elif tok.type == t_STRING:
-			res.register_advancement()
-			self.advance()
-			return res.success(StringNode(tok))
-
-		elif tok.type == t_IDENTIFIER:
-			res.register_advancement()
-			self.advance()
-			return res.success(VarAccessNode(tok))
-
-		elif tok.type == t_LPAREN:
-			res.register_advancement()
-			self.advance()
-			expr = res.register(self.expr())
-			if res.error: return res
-			if self.current_tok.type == t_RPAREN:
-				res.register_advancement()
-				self.advance()
-				return res.success(expr)
+				return None
+
+		if not (before or after): return None
+		lo = self.index(before) + 1 if before else start
+		hi = self.index(after) if after else end
+		# An operator that was lexed again is no longer in tokens
+		if lo == 0 or hi < 0: return None
+		return lo, hi, node
+
+	def index(self, tok):
+		# Where tok is in tokens, or -1
+		i = bisect.bisect_left(self.tokens, tok.pos_start, key=token_start)
+		return i if i < len(self.tokens) and self.tokens[i] is tok else -1
+
+	def reparse(self, start, end, old_node, mode, first, changed, count, delta):
+		# Parses tokens[start:end] again in place of old_node, if that is where
+		# the parse stops. end is an index into the edited tokens
+		tokens = self.tokens
+		parsed = []
+		parser = Parser(islice(tokens, start, None), self.source, parsed)
+		try:
+			node = parser.expr(mode)
+		except Failure:
+			return False
+		if parser.tok_idx != end - start: return False
+
+		self.units = list(self.shift_units(start, end - count, count, old_node, node))
+		self.units.extend((unit_start + start, unit_end + start, unit_node) for unit_start, unit_end, unit_node in parsed)
+		# Nodes are still where they were before the edit
+		self.splice(old_node, node, tokens[start].pos_start if start < first else changed, tokens[end].pos_start - delta, delta)
+		return True
+
+	def shift_units(self, start, end, count, old_node, node):
+		for unit_start, unit_end, unit_node in self.units:
+			if start <= unit_start and unit_end <= end: continue
+			if unit_node is old_node: unit_node = node
+
+			if unit_start >= end:
+				yield unit_start + count, unit_end + count, unit_node
+			elif unit_end >= end:
+				yield unit_start, unit_end + count, unit_node
 			else:
-				return res.failure(InvalidSyntaxError(
-					self.current_tok.pos_start, self.current_tok.pos_end,
-					"Expected ')'"
-				))
-		
-		elif tok.matches(t_KEYWORD, 'IF'):
-			if_expr = res.register(self.if_expr())
-			if res.error: return res
-			return res.success(if_expr)
-
-		elif tok.matches(t_KEYWORD, 'FOR'):
-			for_expr = res.register(self.for_expr())
-			if res.error: return res
-			return res.success(for_expr)
-
-		elif tok.matches(t_KEYWORD, 'WHILE'):
-			while_expr = res.register(self.while_expr())
-			if res.error: return res
-			return res.success(while_expr)
-
-		elif tok.matches(t_KEYWORD, 'FUN'):
-			func_def = res.register(self.func_def())
-			if res.error: return res
-			return res.success(func_def)
-
-		return res.failure(InvalidSyntaxError(
-			tok.pos_start, tok.pos_end,
-			"Expected int, float, identifier, '+', '-', '(', 'IF', 'FOR', 'WHILE'"
-		))
-
-	def if_expr(self):
-		res = ParseResult()
-		cases = []
-		else_case = None
-
-		if not self.current_tok.matches(t_KEYWORD, 'IF'):
-			return res.failure(InvalidSyntaxError(
-				self.current_tok.pos_start, self.current_tok.pos_end,
-				f"Expected 'IF'"
-			))
-
-		res.register_advancement()
-		self.advance()
-
-		condition = res.register(self.expr())
-		if res.error: return res
-
-		if not self.current_tok.matches(t_KEYWORD, 'THEN'):
-			return res.failure(InvalidSyntaxError(
-				self.current_tok.pos_start, self.current_tok.pos_end,
-				f"Expected 'THEN'"
-			))
-
-		res.register_advancement()
-		self.advance()
-
-		expr = res.register(self.expr())
-		if res.error: return res
-		cases.append((condition, expr))
-
-		while self.current_tok.matches(t_KEYWORD, 'ELIF'):
-			res.register_advancement()
-			self.advance()
-
-			condition = res.register(self.expr())
-			if res.error: return res
-
-			if not self.current_tok.matches(t_KEYWORD, 'THEN'):
-				return res.failure(InvalidSyntaxError(
-					self.current_tok.pos_start, self.current_tok.pos_end,
-					f"Expected 'THEN'"
-				))
-
-			res.register_advancement()
-			self.advance()
-
-			expr = res.register(self.expr())
-			if res.error: return res
-			cases.append((condition, expr))
-
-		if self.current_tok.matches(t_KEYWORD, 'ELSE'):
-			res.register_advancement()
-			self.advance()
-
-			else_case = res.register(self.expr())
-			if res.error: return res
-
-		return res.success(IfNode(cases, else_case))
-
-	def for_expr(self):
-		res = ParseResult()
-
-		if not self.current_tok.matches(t_KEYWORD, 'FOR'):
-			return res.failure(InvalidSyntaxError(
-				self.current_tok.pos_start, self.current_tok.pos_end,
-				f"Expected 'FOR'"
-			))
-
-		res.register_advancement()
-		self.advance()
-
-		if self.current_tok.type != t_IDENTIFIER:
-			return res.failure(InvalidSyntaxError(
-				self.current_tok.pos_start, self.current_tok.pos_end,
-				f"Expected identifier"
-			))
-
-		var_name = self.current_tok
-		res.register_advancement()
-		self.advance()
-
-		if self.current_tok.type != t_EQ:
-			return res.failure(InvalidSyntaxError(
-				self.current_tok.pos_start, self.current_tok.pos_end,
-				f"Expected '='"
-			))
-		
-		res.register_advancement()
-		self.advance()
-
-		start_value = res.register(self.expr())
-		if res.error: return res
-
-		if not self.current_tok.matches(t_KEYWORD, 'TO'):
-			return res.failure(InvalidSyntaxError(
-				self.current_tok.pos_start, self.current_tok.pos_end,
-				f"Expected 'TO'"
-			))
-		
-		res.register_advancement()
-		self.advance()
-
-		end_value = res.register(self.expr())
-		if res.error: return res
-
-		if self.current_tok.matches(t_KEYWORD, 'STEP'):
-			res.register_advancement()
-			self.advance()
-
-			step_value = res.register(self.expr())
-			if res.error: return res
-		else:
-			step_value = None
-
-		if not self.current_tok.matches(t_KEYWORD, 'THEN'):
-			return res.failure(InvalidSyntaxError(
-				self.current_tok.pos_start, self.current_tok.pos_end,
-				f"Expected 'THEN'"
-			))
-
-		res.register_advancement()
-		self.advance()
-
-		body = res.register(self.expr())
-		if res.error: return res
-
-		return res.success(ForNode(var_name, start_value, end_value, step_value, body))
-
-	def while_expr(self):
-		res = ParseResult()
-
-		if not self.current_tok.matches(t_KEYWORD, 'WHILE'):
-			return res.failure(InvalidSyntaxError(
-				self.current_tok.pos_start, self.current_tok.pos_end,
-				f"Expected 'WHILE'"
-			))
-
-		res.register_advancement()
-		self.advance()
-
-		condition = res.register(self.expr())
-		if res.error: return res
-
-		if not self.current_tok.matches(t_KEYWORD, 'THEN'):
-			return res.failure(InvalidSyntaxError(
-				self.current_tok.pos_start, self.current_tok.pos_end,
-				f"Expected 'THEN'"
-			))
-
-		res.register_advancement()
-		self.advance()
-
-		body = res.register(self.expr())
-		if res.error: return res
-
-		return res.success(WhileNode(condition, body))
-
-	def bin_op(self, func_a, ops, func_b=None):
-		if func_b == None:
-			func_b = func_a
-		
-		res = ParseResult()
-		left = res.register(func_a())
-		if res.error: return res
-
-		while self.current_tok.type in ops or (self.current_tok.type, self.current_tok.value) in ops:
-			op_tok = self.current_tok
-			res.register_advancement()
-			self.advance()
-			right = res.register(func_b())
-			if res.error: return res
-			left = BinOpNode(left, op_tok, right)
+				yield unit_start, unit_end, unit_node
+
+	def splice(self, old_node, node, unit_start, follow, delta):
+		# Puts node where old_node was. Nodes that start after the re-parsed
+		# tokens move by delta; those around them are given their positions
+		# again from their (already moved) parts, as their constructors did
+		if self.node is old_node:
+			self.node = node
+			return
+
+		stack = [self.node]
+		around = []
+		moved = []
+
+		while stack:
+			parent = stack.pop()
+
+			if parent.pos_start >= follow:
+				moved.append(parent)
+				continue
+
+			if self.last_end(parent) <= unit_start: continue
+			around.append(parent)
+
+			if type(parent) is BinOpNode:
+				# The links of a long operator chain
+				if parent.left_node is old_node: parent.left_node = node
+				elif parent.right_node is old_node: parent.right_node = node
+				if parent.left_node is not node: stack.append(parent.left_node)
+				if parent.right_node is not node: stack.append(parent.right_node)
+				continue
+
+			if type(parent) is IfNode:
+				parent.cases[:] = [(node if condition is old_node else condition, node if expr is old_node else expr) for condition, expr in parent.cases]
+				if parent.else_case is old_node: parent.else_case = node
+			else:
+				for field in CHILD_FIELDS.get(type(parent), ()):
+					if getattr(parent, field) is old_node: setattr(parent, field, node)
+
+			stack.extend(child for child in child_nodes(parent) if child is not node)
+
+		push = moved.append
+		while moved:
+			child = moved.pop()
+			child.pos_start += delta
+			child.pos_end += delta
+
+			kind = type(child)
+			if kind is BinOpNode:
+				push(child.left_node)
+				push(child.right_node)
+			elif kind in CHILD_FIELDS or kind is IfNode:
+				moved.extend(child_nodes(child))
+
+		for parent in reversed(around):
+			kind = type(parent)
+			if kind is IfNode:
+				parent.pos_start = parent.cases[0][0].pos_start
+				parent.pos_end = (parent.else_case or parent.cases[-1][0]).pos_end
+			elif kind in (VarAssignNode, ForNode):
+				parent.pos_start = parent.var_name_tok.pos_start
+			elif kind is UnaryOpNode:
+				parent.pos_start = parent.op_tok.pos_start
+
+			fields = CHILD_FIELDS.get(kind)
+			if fields:
+				if kind in (BinOpNode, WhileNode): parent.pos_start = getattr(parent, fields[0]).pos_start
+				parent.pos_end = getattr(parent, fields[-1]).pos_end
+
+	def last_end(self, node):
+		# Where the last token of node ends. pos_end falls short of it when the
+		# node ends in an IfNode, whose pos_end is that of a condition
+		while True:
+			if type(node) is BinOpNode:
+				node = node.right_node
+				continue
+			if type(node) is IfNode:
+				node = node.else_case or node.cases[-1][1]
+				continue
+
+			fields = CHILD_FIELDS.get(type(node))
+			if not fields: return node.pos_end
+			node = getattr(node, fields[-1])
+
+class OperationError:
+	# Values do not know where they came from, so a failed operation reports
+	# one of these and the engine turns it into an RTError: over the whole
+	# expression, or over the right operand for division by zero
+	__slots__ = ('details', 'right_operand', 'error_class')
+
+	def __init__(self, details, right_operand=False, error_class=RTError):
+		self.details = details
+		self.right_operand = right_operand
+		self.error_class = error_class
+
+	def at(self, pos_start, pos_end, right_start, context):
+		if self.right_operand: pos_start = right_start
+		return self.error_class(
+			Position(pos_start, context.source), Position(pos_end, context.source),
+			self.details,
+			context
+		)
 
-		return res.success(left)
+ILLEGAL_OPERATION = OperationError('Illegal operation')
+DIVISION_BY_ZERO = OperationError('Can not divide anything by 0', True)
 
-class RTResult:
-	def __init__(self):
-		self.value = None
-		self.error = None
+def too_large(max_size):
+	return OperationError(f'Result would take more than {max_size} bytes', error_class=BudgetError)
 
-	def register(self, res):
-		self.error = res.error
-		return res.value
+# Roughly how many bytes a value, or the result of an operation, takes; enough
+# to refuse a huge '^' or string repetition before it is computed
+def value_size(value):
+	if type(value) is int: return (value.bit_length() + 7) // 8
+	if type(value) is str: return len(value)
+	return 8
 
-	def success(self, value):
-		self.value = value
-		return self
+def power_size(base, exponent):
+	if type(base) is not int or type(exponent) is not int or exponent <= 0 or -1 <= base <= 1:
+		return 8
+	return (base.bit_length() * exponent + 7) // 8
 
-	def failure(self, error):
-		self.error = error
-		return self
+def repeat_size(string, count):
+	return len(string) * count if type(count) is int else 8
 
 class Value:
-	def __init__(self):
-		self.set_pos()
-		self.set_context()
-
-	def set_pos(self, pos_start=None, pos_end=None):
-		self.pos_start = pos_start
-		self.pos_end = pos_end
-		return self
-
-	def set_context(self, context=None):
-		self.context = context
-		return self
+	# Values are immutable, so they can be shared freely: variables hand out the
+	# stored value itself and small numbers are interned (see make_number)
+	__slots__ = ()
 
 	def added_to(self, other):
 		return None, self.illegal_operation(other)
@@ -833,118 +1231,103 @@ class Value:
 	def ored_by(self, other):
 		return None, self.illegal_operation(other)
 
-	def copy(self):
-		raise Exception('No copy method defined')
-
 	def is_true(self):
 		return False
 
 	def illegal_operation(self, other=None):
-		if not other: other = self
-		return RTError(
-			self.pos_start, other.pos_end,
-			'Illegal operation',
-			self.context
-		)
+		return ILLEGAL_OPERATION
 
 class Number(Value):
+	__slots__ = ('value',)
+
 	def __init__(self, value):
-		super().__init__()
 		self.value = value
 
 	def added_to(self, other):
 		if isinstance(other, Number):
-			return Number(self.value + other.value).set_context(self.context), None
+			return make_number(self.value + other.value), None
 		else:
 			return None, Value.illegal_operation(self, other)
 
 	def subbed_by(self, other):
 		if isinstance(other, Number):
-			return Number(self.value - other.value).set_context(self.context), None
+			return make_number(self.value - other.value), None
 		else:
 			return None, Value.illegal_operation(self, other)
 
 	def multed_by(self, other):
 		if isinstance(other, Number):
-			return Number(self.value * other.value).set_context(self.context), None
+			return make_number(self.value * other.value), None
 		else:
 			return None, Value.illegal_operation(self, other)
 
 	def dived_by(self, other):
 		if isinstance(other, Number):
 			if other.value == 0:
-				return None, RTError(
-					other.pos_start, other.pos_end,
-					'Can not divide anything by 0',
-					self.context
-				)
+				return None, DIVISION_BY_ZERO
 
-			return Number(self.value / other.value).set_context(self.context), None
+			return Number(self.value / other.value), None
 		else:
 			return None, Value.illegal_operation(self, other)
 
-	def powed_by(self, other):
+	def powed_by(self, other, max_size=None):
 		if isinstance(other, Number):
-			return Number(self.value ** other.value).set_context(self.context), None
+			if max_size is not None and power_size(self.value, other.value) > max_size:
+				return None, too_large(max_size)
+			return make_number(self.value ** other.value), None
 		else:
 			return None, Value.illegal_operation(self, other)
 
 	def get_comparison_eq(self, other):
 		if isinstance(other, Number):
-			return Number(int(self.value == other.value)).set_context(self.context), None
+			return (TRUE if self.value == other.value else FALSE), None
 		else:
 			return None, Value.illegal_operation(self, other)
 
 	def get_comparison_ne(self, other):
 		if isinstance(other, Number):
-			return Number(int(self.value != other.value)).set_context(self.context), None
+			return (TRUE if self.value != other.value else FALSE), None
 		else:
 			return None, Value.illegal_operation(self, other)
 
 	def get_comparison_lt(self, other):
 		if isinstance(other, Number):
-			return Number(int(self.value < other.value)).set_context(self.context), None
+			return (TRUE if self.value < other.value else FALSE), None
 		else:
 			return None, Value.illegal_operation(self, other)
 
 	def get_comparison_gt(self, other):
 		if isinstance(other, Number):
-			return Number(int(self.value > other.value)).set_context(self.context), None
+			return (TRUE if self.value > other.value else FALSE), None
 		else:
 			return None, Value.illegal_operation(self, other)
 
 	def get_comparison_lte(self, other):
 		if isinstance(other, Number):
-			return Number(int(self.value <= other.value)).set_context(self.context), None
+			return (TRUE if self.value <= other.value else FALSE), None
 		else:
 			return None, Value.illegal_operation(self, other)
 
 	def get_comparison_gte(self, other):
 		if isinstance(other, Number):
-			return Number(int(self.value >= other.value)).set_context(self.context), None
+			return (TRUE if self.value >= other.value else FALSE), None
 		else:
 			return None, Value.illegal_operation(self, other)
 
 	def anded_by(self, other):
 		if isinstance(other, Number):
-			return Number(int(self.value and other.value)).set_context(self.context), None
+			return make_number(int(self.value and other.value)), None
 		else:
 			return None, Value.illegal_operation(self, other)
 
 	def ored_by(self, other):
 		if isinstance(other, Number):
-			return Number(int(self.value or other.value)).set_context(self.context), None
+			return make_number(int(self.value or other.value)), None
 		else:
 			return None, Value.illegal_operation(self, other)
 
 	def notted(self):
-		return Number(1 if self.value == 0 else 0).set_context(self.context), None
-
-	def copy(self):
-		copy = Number(self.value)
-		copy.set_pos(self.pos_start, self.pos_end)
-		copy.set_context(self.context)
-		return copy
+		return (TRUE if self.value == 0 else FALSE), None
 
 	def is_true(self):
 		return self.value != 0
@@ -952,32 +1335,53 @@ class Number(Value):
 	def __repr__(self):
 		return str(self.value)
 
+SMALL_NUMBERS = [Number(i) for i in range(-5, 257)]
+FALSE = SMALL_NUMBERS[5]
+TRUE = SMALL_NUMBERS[6]
+MINUS_ONE = SMALL_NUMBERS[4]
+
+def make_number(value):
+	if type(value) is int and -5 <= value <= 256:
+		return SMALL_NUMBERS[value + 5]
+	return Number(value)
+
+def for_range(start, end, step):
+	# The values a FOR loop takes as a range, when every one of them is an int;
+	# None sends the loop down the general path (floats, strings, a zero step)
+	if type(start) is not int or type(step) is not int or step == 0:
+		return None
+
+	if type(end) is float:
+		if not math.isfinite(end): return None
+		end = math.ceil(end) if step > 0 else math.floor(end)
+	elif type(end) is not int:
+		return None
+
+	return range(start, end, step)
+
 class String(Value):
+	__slots__ = ('value',)
+
 	def __init__(self, value):
-		super().__init__()
 		self.value = value
 
 	def added_to(self, other):
 		if isinstance(other, String):
-			return String(self.value + other.value).set_context(self.context), None
+			return String(self.value + other.value), None
 		else:
 			return None, Value.illegal_operation(self, other)
 
-	def multed_by(self, other):
+	def multed_by(self, other, max_size=None):
 		if isinstance(other, Number):
-			return String(self.value * other.value).set_context(self.context), None
+			if max_size is not None and repeat_size(self.value, other.value) > max_size:
+				return None, too_large(max_size)
+			return String(self.value * other.value), None
 		else:
 			return None, Value.illegal_operation(self, other)
 
 	def is_true(self):
 		return len(self.value) > 0
 
-	def copy(self):
-		copy = String(self.value)
-		copy.set_pos(self.pos_start, self.pos_end)
-		copy.set_context(self.context)
-		return copy
-
 	def __repr__(self):
 		return f'"{self.value}"'
 
@@ -987,6 +1391,8 @@ class Context:
 		self.parent = parent
 		self.parent_entry_pos = parent_entry_pos
 		self.symbol_table = None
+		self.frame = None
+		self.source = None
 
 class SymbolTable:
 	def __init__(self, parent=None):
@@ -995,7 +1401,7 @@ class SymbolTable:
 
 	def get(self, name):
 		value = self.symbols.get(name, None)
-		if value == None and self.parent:
+		if value is None and self.parent:
 			return self.parent.get(name)
 		return value
 
@@ -1005,7 +1411,123 @@ class SymbolTable:
 	def remove(self, name):
 		del self.symbols[name]
 
+# While a program runs its variables live in a frame, a list with one value
+# per slot (None for undefined), loaded from the symbol table before it starts
+# and written back once it stops, however it stops
+def load_frame(symbol_table, names):
+	return [symbol_table.get(name) for name in names]
+
+def store_frame(symbol_table, names, frame, loaded):
+	# Only slots the program assigned go back, so a name only read from a
+	# parent table is not copied into this one
+	for name, value, old in zip(names, frame, loaded):
+		if value is not old:
+			symbol_table.set(name, value)
+
+# Operations quickened BinOpNodes run straight on the operands' values,
+# keyed by (operation, type of the left value, type of the right value).
+# Only operations that can not fail on those types are here, so division,
+# which can fail on any of them, never is. Small ints are interned here
+# rather than through make_number, and floats need no interning at all
+def add_ints(a, b):
+	value = a + b
+	return SMALL_NUMBERS[value + 5] if -5 <= value <= 256 else Number(value)
+
+def sub_ints(a, b):
+	value = a - b
+	return SMALL_NUMBERS[value + 5] if -5 <= value <= 256 else Number(value)
+
+def mul_ints(a, b):
+	value = a * b
+	return SMALL_NUMBERS[value + 5] if -5 <= value <= 256 else Number(value)
+
+COMPARISON_HANDLERS = {
+	'get_comparison_eq': lambda a, b: TRUE if a == b else FALSE,
+	'get_comparison_ne': lambda a, b: TRUE if a != b else FALSE,
+	'get_comparison_lt': lambda a, b: TRUE if a < b else FALSE,
+	'get_comparison_gt': lambda a, b: TRUE if a > b else FALSE,
+	'get_comparison_lte': lambda a, b: TRUE if a <= b else FALSE,
+	'get_comparison_gte': lambda a, b: TRUE if a >= b else FALSE,
+	'anded_by': lambda a, b: make_number(int(a and b)),
+	'ored_by': lambda a, b: make_number(int(a or b)),
+	'powed_by': lambda a, b: make_number(a ** b)
+}
+
+FLOAT_HANDLERS = {
+	'added_to': lambda a, b: Number(a + b),
+	'subbed_by': lambda a, b: Number(a - b),
+	'multed_by': lambda a, b: Number(a * b)
+}
+
+QUICK_HANDLERS = {
+	('added_to', int, int): add_ints,
+	('subbed_by', int, int): sub_ints,
+	('multed_by', int, int): mul_ints,
+	('added_to', str, str): lambda a, b: String(a + b),
+	('multed_by', str, int): lambda a, b: String(a * b)
+}
+for left_type, right_type in ((int, int), (int, float), (float, int), (float, float)):
+	for op, handler in COMPARISON_HANDLERS.items():
+		QUICK_HANDLERS[(op, left_type, right_type)] = handler
+	if float in (left_type, right_type):
+		for op, handler in FLOAT_HANDLERS.items():
+			QUICK_HANDLERS[(op, left_type, right_type)] = handler
+
+class InlineCache:
+	# What one BinOpNode has seen of its operands. Once it has run QUICKEN_AFTER
+	# times in a row on the same value types, and there is a handler for them,
+	# entry holds (left type, right type, handler) and the interpreter calls
+	# the handler whenever both types match; when they do not, the node runs
+	# the usual way and may be quickened again for the new types. Caches
+	# belong to one run (see Interpreter.caches), never to the node, which
+	# cached programs share between sessions and threads
+	QUICKEN_AFTER = 8
+	__slots__ = ('entry', 'left_type', 'right_type', 'streak', 'hits', 'misses')
+
+	def __init__(self):
+		self.entry = None
+		self.left_type = None
+		self.right_type = None
+		self.streak = 0
+		self.hits = 0
+		self.misses = 0
+
+	def observe(self, op_tok, left, right):
+		left_type = type(left.value)
+		right_type = type(right.value)
+
+		if left_type is not self.left_type or right_type is not self.right_type:
+			self.left_type = left_type
+			self.right_type = right_type
+			self.streak = 1
+		elif self.streak < self.QUICKEN_AFTER:
+			self.streak += 1
+			if self.streak == self.QUICKEN_AFTER:
+				op = BINARY_OPS.get(op_tok.type) or BINARY_OPS[(op_tok.type, op_tok.value)]
+				handler = QUICK_HANDLERS.get((op, left_type, right_type))
+				if handler is not None: self.entry = (left_type, right_type, handler)
+
 class Interpreter:
+	# Walks the tree with one Python call per node, so how deep a program can
+	# nest is bounded by the recursion limit; see Session.run. An Interpreter
+	# is meant for one run: caches maps the BinOpNodes it has run to their
+	# InlineCache
+	def __init__(self):
+		self.caches = {}
+
+	def inline_cache_stats(self, stats=None):
+		# Adds up, into stats if given, how many BinOpNodes ran, how many were
+		# quickened, and how often quickened ones hit or missed
+		if stats is None: stats = {'nodes': 0, 'quickened': 0, 'hits': 0, 'misses': 0}
+
+		for cache in self.caches.values():
+			stats['nodes'] += 1
+			if cache.entry is not None: stats['quickened'] += 1
+			stats['hits'] += cache.hits
+			stats['misses'] += cache.misses
+
+		return stats
+
 	def visit(self, node, context):
 		method_name = f'visit_{type(node).__name__}'
 		method = getattr(self, method_name, self.no_visit_method)
@@ -1014,46 +1536,55 @@ class Interpreter:
 	def no_visit_method(self, node, context):
 		raise Exception(f'No visit_{type(node).__name__} method defined')
 
+	def visitor(self, node):
+		# What visit would call for node, for loops to look up only once
+		return getattr(self, f'visit_{type(node).__name__}', self.no_visit_method)
+
 	def visit_NumberNode(self, node, context):
-		return RTResult().success(
-			Number(node.tok.value).set_context(context).set_pos(node.pos_start, node.pos_end)
-		)
+		return make_number(node.tok.value)
 
 	def visit_StringNode(self, node, context):
-		return RTResult().success(
-			String(node.tok.value).set_context(context).set_pos(node.pos_start, node.pos_end)
-		)
+		return String(node.tok.value)
+
+	def visit_ProgramNode(self, node, context):
+		loaded = load_frame(context.symbol_table, node.names)
+		context.frame = frame = loaded[:]
+
+		try:
+			return self.visit(node.body_node, context)
+		finally:
+			store_frame(context.symbol_table, node.names, frame, loaded)
 
 	def visit_VarAccessNode(self, node, context):
-		res = RTResult()
-		var_name = node.var_name_tok.value
-		value = context.symbol_table.get(var_name)
+		value = context.frame[node.slot]
 
-		if not value:
-			return res.failure(RTError(
-				node.pos_start, node.pos_end,
-				f"'{var_name}' is not defined",
+		if value is None:
+			raise Failure(RTError(
+				Position(node.pos_start, context.source), Position(node.pos_end, context.source),
+				f"'{node.var_name_tok.value}' is not defined",
 				context
 			))
 
-		value = value.copy().set_pos(node.pos_start, node.pos_end)
-		return res.success(value)
+		return value
 
 	def visit_VarAssignNode(self, node, context):
-		res = RTResult()
-		var_name = node.var_name_tok.value
-		value = res.register(self.visit(node.value_node, context))
-		if res.error: return res
-
-		context.symbol_table.set(var_name, value)
-		return res.success(value)
+		value = self.visit(node.value_node, context)
+		context.frame[node.slot] = value
+		return value
 
 	def visit_BinOpNode(self, node, context):
-		res = RTResult()
-		left = res.register(self.visit(node.left_node, context))
-		if res.error: return res
-		right = res.register(self.visit(node.right_node, context))
-		if res.error: return res
+		left = self.visit(node.left_node, context)
+		right = self.visit(node.right_node, context)
+
+		cache = self.caches.get(node)
+		if cache is not None:
+			entry = cache.entry
+			if entry is not None:
+				left_type, right_type, handler = entry
+				if type(left.value) is left_type and type(right.value) is right_type:
+					cache.hits += 1
+					return handler(left.value, right.value)
+				cache.misses += 1
 
 		if node.op_tok.type == t_PLUS:
 			result, error = left.added_to(right)
@@ -1082,112 +1613,1904 @@ class Interpreter:
 		elif node.op_tok.matches(t_KEYWORD, 'OR'):
 			result, error = left.ored_by(right)
 
-		if error:
-			return res.failure(error)
-		else:
-			return res.success(result.set_pos(node.pos_start, node.pos_end))
+		if error: raise Failure(error.at(node.pos_start, node.pos_end, node.right_node.pos_start, context))
 
-	def visit_UnaryOpNode(self, node, context):
-		res = RTResult()
-		number = res.register(self.visit(node.node, context))
-		if res.error: return res
+		if cache is None: cache = self.caches[node] = InlineCache()
+		cache.observe(node.op_tok, left, right)
+		return result
 
+	def visit_UnaryOpNode(self, node, context):
+		number = self.visit(node.node, context)
 		error = None
 
 		if node.op_tok.type == t_MINUS:
-			number, error = number.multed_by(Number(-1))
+			number, error = number.multed_by(MINUS_ONE)
 		elif node.op_tok.matches(t_KEYWORD, 'NOT'):
 			number, error = number.notted()
 
-		if error:
-			return res.failure(error)
-		else:
-			return res.success(number.set_pos(node.pos_start, node.pos_end))
+		if error: raise Failure(error.at(node.pos_start, node.pos_end, node.node.pos_start, context))
+		return number
 
 	def visit_IfNode(self, node, context):
-		res = RTResult()
-
 		for condition, expr in node.cases:
-			condition_value = res.register(self.visit(condition, context))
-			if res.error: return res
-
-			if condition_value.is_true():
-				expr_value = res.register(self.visit(expr, context))
-				if res.error: return res
-				return res.success(expr_value)
+			if self.visit(condition, context).is_true():
+				return self.visit(expr, context)
 
 		if node.else_case:
-			else_value = res.register(self.visit(node.else_case, context))
-			if res.error: return res
-			return res.success(else_value)
+			return self.visit(node.else_case, context)
 
-		return res.success(None)
+		return None
 
 	def visit_ForNode(self, node, context):
-		res = RTResult()
-
-		start_value = res.register(self.visit(node.start_value_node, context))
-		if res.error: return res
-
-		end_value = res.register(self.visit(node.end_value_node, context))
-		if res.error: return res
+		start_value = self.visit(node.start_value_node, context)
+		end_value = self.visit(node.end_value_node, context)
 
 		if node.step_value_node:
-			step_value = res.register(self.visit(node.step_value_node, context))
-			if res.error: return res
+			step_value = self.visit(node.step_value_node, context)
 		else:
-			step_value = Number(1)
+			step_value = TRUE
+
+		slot = node.slot
+		body_node = node.body_node
+		visit_body = self.visitor(body_node)
+		frame = context.frame
 
 		i = start_value.value
+		step = step_value.value
+		up = step >= 0
+		end = end_value.value
+		plan = for_range(i, end, step)
+
+		# The loop variable is written straight into its slot and the body's
+		# result is dropped; reassigning the variable in the body doesn't
+		# change the values the loop takes
+		if plan is not None:
+			for i in plan:
+				frame[slot] = make_number(i)
+				visit_body(body_node, context)
+		elif up:
+			while i < end:
+				frame[slot] = make_number(i)
+				i += step
+				visit_body(body_node, context)
+		else:
+			while i > end:
+				frame[slot] = make_number(i)
+				i += step
+				visit_body(body_node, context)
+
+		return None
+
+	def visit_WhileNode(self, node, context):
+		while self.visit(node.condition_node, context).is_true():
+			self.visit(node.body_node, context)
+
+		return None
+
+class Profile:
+	# What a ProfilingInterpreter saw, over any number of runs. by_type and
+	# by_span map a node type, or (node type, pos_start, pos_end, source), to
+	# [visits, self time, inclusive time]. Time a node spends under another
+	# node of its own type (or span) counts once towards its inclusive time.
+	# calls is the tree of nested visits, [self time, {span: subtree}], for
+	# flame graphs
+	def __init__(self):
+		self.by_type = {}
+		self.by_span = {}
+		self.calls = [0.0, {}]
+		self.sources = {}
+
+	def source(self, source):
+		# Runs of the same text share their spans
+		if source is None: return None
+		text = source.text
+		return self.sources.setdefault((source.fn, text if isinstance(text, (str, bytes)) else id(text)), source)
+
+	def where(self, source, pos_start):
+		if source is None: return f'<unknown>:{pos_start}'
+		ln, col = source.line_col(pos_start)
+		return f'{source.fn}:{ln + 1}:{col + 1}'
+
+	def snippet(self, source, pos_start, pos_end, width=40):
+		if source is None: return ''
+		text = source.text[pos_start:pos_end]
+		if not isinstance(text, str): text = bytes(text).decode('utf-8', 'replace')
+		text = ' '.join(text.split())
+		return text if len(text) <= width else text[:width - 3] + '...'
+
+	def report(self, limit=20):
+		# Node types, then the slowest spans, by self time
+		lines = [f'{"node type":<16}{"visits":>10}{"self ms":>12}{"inclusive ms":>14}']
+		for kind, (visits, own, inclusive) in sorted(self.by_type.items(), key=lambda item: -item[1][1]):
+			lines.append(f'{kind:<16}{visits:>10}{own * 1000:>12.3f}{inclusive * 1000:>14.3f}')
+
+		lines.append('')
+		lines.append(f'{"where":<24}{"node type":<16}{"visits":>10}{"self ms":>12}{"inclusive ms":>14}  text')
+		spans = sorted(self.by_span.items(), key=lambda item: -item[1][1])
+		for (kind, pos_start, pos_end, source), (visits, own, inclusive) in spans[:limit]:
+			lines.append(
+				f'{self.where(source, pos_start):<24}{kind:<16}{visits:>10}{own * 1000:>12.3f}{inclusive * 1000:>14.3f}'
+				f'  {self.snippet(source, pos_start, pos_end)}'
+			)
+
+		return '\n'.join(lines)
+
+	def collapsed(self):
+		# One 'frame;frame;...;frame microseconds' line per chain of nested
+		# visits, as flamegraph.pl, speedscope and similar tools read them
+		lines = []
+		stack = [((), self.calls)]
+		while stack:
+			frames, (own, children) = stack.pop()
+			if frames and round(own * 1e6):
+				lines.append(f'{";".join(frames)} {round(own * 1e6)}')
+			for (kind, pos_start, pos_end, source), subtree in children.items():
+				stack.append((frames + (f'{kind} {self.where(source, pos_start)}'.replace(';', ','),), subtree))
+
+		return '\n'.join(reversed(lines))
+
+class ProfilingInterpreter(Interpreter):
+	# An Interpreter that times every visit into a Profile. Being a subclass
+	# leaves the plain Interpreter's visit without a single extra check
+	def __init__(self, profile):
+		super().__init__()
+		self.profile = profile
+		self.source = None
+		self.calls = [profile.calls]
+		self.active_types = {}
+		self.active_spans = {}
+		self.child_time = 0.0
+
+	def visitor(self, node):
+		return self.visit
+
+	def visit(self, node, context):
+		profile = self.profile
+		if self.source is None: self.source = profile.source(context.source)
+
+		kind = type(node).__name__
+		span = (kind, node.pos_start, node.pos_end, self.source)
+		children = self.calls[-1][1]
+		calls = children.get(span)
+		if calls is None: calls = children[span] = [0.0, {}]
+		self.calls.append(calls)
+
+		outer_type = self.active_types.get(kind, 0)
+		outer_span = self.active_spans.get(span, 0)
+		self.active_types[kind] = outer_type + 1
+		self.active_spans[span] = outer_span + 1
+		child_time = self.child_time
+		self.child_time = 0.0
+		start = perf_counter()
+
+		try:
+			return Interpreter.visit(self, node, context)
+		finally:
+			elapsed = perf_counter() - start
+			own = elapsed - self.child_time
+			self.child_time = child_time + elapsed
+			calls[0] += own
+			self.calls.pop()
+			self.active_types[kind] = outer_type
+			self.active_spans[span] = outer_span
+
+			for table, key, outer in ((profile.by_type, kind, outer_type), (profile.by_span, span, outer_span)):
+				stats = table.get(key)
+				if stats is None: stats = table[key] = [0, 0.0, 0.0]
+				stats[0] += 1
+				stats[1] += own
+				if not outer: stats[2] += elapsed
+
+class SamplingProfiler:
+	# Every interval seconds a background thread looks at the profiled
+	# thread's stack and counts the node its innermost Interpreter visit_
+	# method is running. The interpreter itself does nothing extra, so the
+	# only cost is the sampling thread's, a few microseconds per sample. A
+	# busy thread only lets go of the GIL every sys.getswitchinterval(), so
+	# samples come at most that often
+	def __init__(self, interval=0.005, thread=None):
+		self.interval = interval
+		self.thread_id = (thread or threading.current_thread()).ident
+		self.samples = {}
+		self.idle = 0
+		self.stopped = threading.Event()
+		self.sampler = None
+
+	def __enter__(self):
+		self.start()
+		return self
+
+	def __exit__(self, *exc_info):
+		self.stop()
+
+	def start(self):
+		self.stopped.clear()
+		self.sampler = threading.Thread(target=self.sample, daemon=True)
+		self.sampler.start()
+
+	def stop(self):
+		self.stopped.set()
+		self.sampler.join()
+
+	def sample(self):
+		codes = {method.__code__ for name, method in vars(Interpreter).items() if name.startswith('visit_')}
+
+		while not self.stopped.wait(self.interval):
+			frame = sys._current_frames().get(self.thread_id)
+			while frame is not None and frame.f_code not in codes:
+				frame = frame.f_back
+
+			if frame is None:
+				self.idle += 1
+				continue
+
+			local_vars = frame.f_locals
+			key = (local_vars['context'].source, local_vars['node'].pos_start)
+			self.samples[key] = self.samples.get(key, 0) + 1
+
+	def hits(self):
+		# Samples per (file, line, column), counted from 1
+		hits = {}
+		# The sampling thread may still be adding to samples
+		for (source, pos_start), count in list(self.samples.items()):
+			if source is None: continue
+			pos = Position(pos_start, source)
+			key = (pos.fn, pos.ln + 1, pos.col + 1)
+			hits[key] = hits.get(key, 0) + count
+		return hits
+
+	def annotate(self, columns=5):
+		# Each sampled text, every line with its samples and share of them,
+		# and under it a mark at each of its busiest columns
+		sources = {}
+		lines = {}
+		for source, _ in list(self.samples):
+			if source is not None: sources.setdefault(source.fn, source)
+		for (fn, ln, col), count in self.hits().items():
+			lines.setdefault((fn, ln), {})[col] = count
+
+		total = sum(self.samples.values()) or 1
+		out = [f'{sum(self.samples.values())} samples every {self.interval * 1000:g}ms, {self.idle} outside the interpreter']
+		for fn, source in sources.items():
+			text = source.text if isinstance(source.text, str) else bytes(source.text).decode('utf-8', 'replace')
+			out.append('')
+			out.append(fn)
+
+			for ln, line in enumerate(text.split('\n'), 1):
+				cols = lines.get((fn, ln))
+				if not cols:
+					out.append(f'{"":>15}  {line}')
+					continue
+
+				count = sum(cols.values())
+				out.append(f'{count:>8}{count / total:>7.1%}  {line}')
+				for col, count in sorted(cols.items(), key=lambda item: -item[1])[:columns]:
+					out.append(f'{count:>8}{count / total:>7.1%}  {" " * (col - 1)}^')
+
+		return '\n'.join(out)
+
+	def write(self, path):
+		with open(path, 'w') as f:
+			f.write(self.annotate() + '\n')
+
+class Budget:
+	# Limits for a run, each of them optional: how many nodes the interpreter
+	# may evaluate, how many seconds it may take, and how many bytes (see
+	# value_size) a single number or string may take. Time is only looked at
+	# between nodes, so it is max_size that stops one huge '^'
+	def __init__(self, max_nodes=None, timeout=None, max_size=None):
+		self.max_nodes = max_nodes
+		self.timeout = timeout
+		self.max_size = max_size
+
+class BudgetedInterpreter(Interpreter):
+	# An Interpreter that ends the run with a BudgetError once it goes over
+	# its Budget. A visit only counts down to the next check, which looks at
+	# the node count and the clock every CHECK_EVERY nodes
+	CHECK_EVERY = 1024
+
+	def __init__(self, budget):
+		super().__init__()
+		self.budget = budget
+		self.max_size = budget.max_size
+		self.deadline = None if budget.timeout is None else perf_counter() + budget.timeout
+		# Visits allowed up to the next check, and in total by then
+		self.countdown = 0
+		self.allowed = 0
+
+	def visitor(self, node):
+		return self.visit
 
-		if step_value.value >= 0:
-			condition = lambda: i < end_value.value
+	def visit(self, node, context):
+		self.countdown -= 1
+		if self.countdown < 0:
+			error = self.check(node, context)
+			if error: raise Failure(error)
+
+		# Dispatched here rather than through Interpreter.visit, so a level of
+		# nesting takes as many Python frames as without a budget
+		return getattr(self, f'visit_{type(node).__name__}', self.no_visit_method)(node, context)
+
+	def check(self, node, context):
+		budget = self.budget
+		if budget.max_nodes is not None and self.allowed >= budget.max_nodes:
+			details = f'Evaluated more than {budget.max_nodes} nodes'
+		elif self.deadline is not None and perf_counter() > self.deadline:
+			details = f'Took longer than {budget.timeout}s'
 		else:
-			condition = lambda: i > end_value.value
-		
-		while condition():
-			context.symbol_table.set(node.var_name_tok.value, Number(i))
-			i += step_value.value
+			countdown = self.CHECK_EVERY
+			if budget.max_nodes is not None: countdown = min(countdown, budget.max_nodes - self.allowed)
+			self.allowed += countdown
+			# This visit is the first of them
+			self.countdown = countdown - 1
+			return None
+
+		return BudgetError(
+			Position(node.pos_start, context.source), Position(node.pos_end, context.source),
+			details,
+			context
+		)
 
-			res.register(self.visit(node.body_node, context))
-			if res.error: return res
+	def size_failure(self, node, context):
+		return Failure(too_large(self.max_size).at(node.pos_start, node.pos_end, node.pos_start, context))
 
-		return res.success(None)
+	# Literals count too: the optimizer folds constants of up to
+	# Optimizer.MAX_FOLDED_SIZE bytes into them
+	def visit_NumberNode(self, node, context):
+		value = make_number(node.tok.value)
+		if self.max_size is not None and value_size(value.value) > self.max_size: raise self.size_failure(node, context)
+		return value
 
-	def visit_WhileNode(self, node, context):
-		res = RTResult()
+	def visit_StringNode(self, node, context):
+		value = String(node.tok.value)
+		if self.max_size is not None and value_size(value.value) > self.max_size: raise self.size_failure(node, context)
+		return value
+
+	def visit_BinOpNode(self, node, context):
+		# Every operator runs here, none through Interpreter.visit_BinOpNode,
+		# for the same reason as in visit
+		left = self.visit(node.left_node, context)
+		right = self.visit(node.right_node, context)
+		op = BINARY_OPS.get(node.op_tok.type) or BINARY_OPS[(node.op_tok.type, node.op_tok.value)]
+		max_size = self.max_size
+
+		# '^' and repeating a string are refused before they are computed;
+		# '+' and '*' at most double their operands, and are checked after
+		if max_size is None:
+			result, error = getattr(left, op)(right)
+		elif op == 'powed_by':
+			result, error = left.powed_by(right, max_size)
+		elif op == 'multed_by' and isinstance(left, String):
+			result, error = left.multed_by(right, max_size)
+		else:
+			result, error = getattr(left, op)(right)
+			if not error and op in ('added_to', 'multed_by') and value_size(result.value) > max_size:
+				error = too_large(max_size)
+
+		if error: raise Failure(error.at(node.pos_start, node.pos_end, node.right_node.pos_start, context))
+		return result
+
+BINARY_OPS = {
+	t_PLUS: 'added_to',
+	t_MINUS: 'subbed_by',
+	t_MUL: 'multed_by',
+	t_DIV: 'dived_by',
+	t_POW: 'powed_by',
+	t_EE: 'get_comparison_eq',
+	t_NE: 'get_comparison_ne',
+	t_LT: 'get_comparison_lt',
+	t_GT: 'get_comparison_gt',
+	t_LTE: 'get_comparison_lte',
+	t_GTE: 'get_comparison_gte',
+	(t_KEYWORD, 'AND'): 'anded_by',
+	(t_KEYWORD, 'OR'): 'ored_by'
+}
+
+def walk(visitor, node, *args):
+	# Runs a pass whose visit_ methods are generators: they yield a child node,
+	# are sent back its result, and return their own. Methods for leaves may be
+	# plain functions. The pending generators live on a list, so however deep
+	# the tree is, the Python stack is not
+	with GCPaused():
+		stack = []
+		result = visitor.visit(node, *args)
 
 		while True:
-			condition = res.register(self.visit(node.condition_node, context))
-			if res.error: return res
+			if result.__class__ is GeneratorType:
+				generator = result
+				result = None
+			elif stack:
+				generator = stack.pop()
+			else:
+				return result
+
+			try:
+				child = generator.send(result)
+			except StopIteration as stop:
+				result = stop.value
+				continue
+
+			stack.append(generator)
+			result = visitor.visit(child, *args)
+
+class Optimizer:
+	# Folds constant subtrees and applies identities that can not change the
+	# result. Anything that fails (or would blow up) when folded is left in the
+	# tree, so the program still raises the same error, at the same position,
+	# when it runs.
+	MAX_FOLDED_SIZE = 4096
+
+	def __init__(self):
+		# Static type of every operator node built so far, see static_type
+		self.types = {}
+
+	def optimize(self, node):
+		return walk(self, node)
+
+	def visit(self, node):
+		method_name = f'visit_{type(node).__name__}'
+		method = getattr(self, method_name, self.no_visit_method)
+		return method(node)
+
+	def no_visit_method(self, node):
+		raise Exception(f'No visit_{type(node).__name__} method defined')
+
+	def visit_NumberNode(self, node):
+		return node
+
+	def visit_StringNode(self, node):
+		return node
+
+	def visit_VarAccessNode(self, node):
+		return node
+
+	def visit_VarAssignNode(self, node):
+		value_node = yield node.value_node
+		if value_node is node.value_node: return node
+		return VarAssignNode(node.var_name_tok, value_node)
+
+	def visit_BinOpNode(self, node):
+		left_node = yield node.left_node
+		right_node = yield node.right_node
+		op = BINARY_OPS.get(node.op_tok.type) or BINARY_OPS[(node.op_tok.type, node.op_tok.value)]
+
+		left, right = self.constant(left_node), self.constant(right_node)
+		if left and right and self.is_small(op, left, right):
+			folded = self.fold(node, lambda: getattr(left, op)(right))
+			if folded: return folded
+
+		if right_node.__class__ is NumberNode and right_node.tok.type == t_INT:
+			# x * 1 holds for strings too; x ^ 1 needs a number; x + 0 needs an
+			# int, since -0.0 + 0 is 0.0
+			if op == 'multed_by' and right_node.tok.value == 1 and self.static_type(left_node):
+				return left_node
+			if op == 'powed_by' and right_node.tok.value == 1 and self.static_type(left_node) in ('int', 'number'):
+				return left_node
+			if op == 'added_to' and right_node.tok.value == 0 and self.static_type(left_node) == 'int':
+				return left_node
+
+		if left_node is not node.left_node or right_node is not node.right_node:
+			node = BinOpNode(left_node, node.op_tok, right_node)
+		return self.typed(node)
+
+	def visit_UnaryOpNode(self, node):
+		operand = yield node.node
+		value = self.constant(operand)
+
+		if value and node.op_tok.type == t_MINUS:
+			folded = self.fold(node, lambda: value.multed_by(MINUS_ONE))
+			if folded: return folded
+		elif value and node.op_tok.type == t_PLUS:
+			return self.constant_node(value.value, node)
+
+		if operand is not node.node:
+			node = UnaryOpNode(node.op_tok, operand)
+		return self.typed(node)
+
+	def visit_IfNode(self, node):
+		cases = []
+		for condition, expr in node.cases:
+			cases.append(((yield condition), (yield expr)))
+		else_case = (yield node.else_case) if node.else_case else None
+		return IfNode(cases, else_case)
+
+	def visit_ForNode(self, node):
+		start_value_node = yield node.start_value_node
+		end_value_node = yield node.end_value_node
+		step_value_node = (yield node.step_value_node) if node.step_value_node else None
+		body_node = yield node.body_node
+		return ForNode(node.var_name_tok, start_value_node, end_value_node, step_value_node, body_node)
+
+	def visit_WhileNode(self, node):
+		condition_node = yield node.condition_node
+		body_node = yield node.body_node
+		return WhileNode(condition_node, body_node)
+
+	def constant(self, node):
+		if node.__class__ is NumberNode: return make_number(node.tok.value)
+		if node.__class__ is StringNode: return String(node.tok.value)
+		return None
+
+	def constant_node(self, value, node):
+		if type(value) is str:
+			return StringNode(Token(t_STRING, value, node.pos_start, node.pos_end))
+		return NumberNode(Token(t_INT if type(value) is int else t_FLOAT, value, node.pos_start, node.pos_end))
+
+	def fold(self, node, operation):
+		try:
+			result, error = operation()
+		except Exception:
+			# e.g. OverflowError; the interpreter will hit it again at run time
+			return None
+
+		if error or type(result.value) not in (int, float, str): return None
+		return self.constant_node(result.value, node)
+
+	def is_small(self, op, left, right):
+		if op == 'powed_by':
+			return power_size(left.value, right.value) <= self.MAX_FOLDED_SIZE
+		if op == 'multed_by' and isinstance(left, String):
+			return repeat_size(left.value, right.value) <= self.MAX_FOLDED_SIZE
+		if op == 'added_to' and isinstance(left, String) and isinstance(right, String):
+			return len(left.value) + len(right.value) <= self.MAX_FOLDED_SIZE
+		return True
+
+	def typed(self, node):
+		# Operands are optimized first, so their types are already known
+		if node.__class__ is UnaryOpNode:
+			operand_type = self.static_type(node.node)
+			self.types[node] = operand_type if operand_type in ('int', 'float', 'number') else None
+			return node
+
+		if node.op_tok.type not in (t_PLUS, t_MINUS, t_MUL, t_DIV, t_POW):
+			self.types[node] = 'int'
+			return node
+
+		left_type, right_type = self.static_type(node.left_node), self.static_type(node.right_node)
+		if left_type not in ('int', 'float', 'number') or right_type not in ('int', 'float', 'number'):
+			self.types[node] = 'value'
+		elif node.op_tok.type == t_DIV:
+			self.types[node] = 'float'
+		elif node.op_tok.type != t_POW and left_type == right_type == 'int':
+			self.types[node] = 'int'
+		else:
+			self.types[node] = 'number'
+		return node
+
+	def static_type(self, node):
+		# 'int', 'float' or 'number' when a node can only produce a Number,
+		# 'value' when it produces some value (never None), else None
+		if node.__class__ is NumberNode:
+			return 'int' if node.tok.type == t_INT else 'float'
+		if node.__class__ in (StringNode, VarAccessNode):
+			return 'value'
+		return self.types.get(node)
+
+class Resolver:
+	# Gives every variable name in a program a slot, in order of first
+	# appearance, and wraps the tree in a ProgramNode holding the names, so
+	# the engines index a frame instead of looking names up in a SymbolTable
+	def resolve(self, node):
+		self.slots = {}
+		walk(self, node)
+		return ProgramNode(node, list(self.slots))
+
+	def slot(self, name):
+		return self.slots.setdefault(name, len(self.slots))
+
+	def visit(self, node):
+		method_name = f'visit_{type(node).__name__}'
+		method = getattr(self, method_name, self.no_visit_method)
+		return method(node)
+
+	def no_visit_method(self, node):
+		raise Exception(f'No visit_{type(node).__name__} method defined')
+
+	def visit_NumberNode(self, node):
+		pass
+
+	def visit_StringNode(self, node):
+		pass
+
+	def visit_VarAccessNode(self, node):
+		node.slot = self.slot(node.var_name_tok.value)
 
-			if not condition.is_true(): break
+	def visit_VarAssignNode(self, node):
+		yield node.value_node
+		node.slot = self.slot(node.var_name_tok.value)
 
-			res.register(self.visit(node.body_node, context))
-			if res.error: return res
+	def visit_BinOpNode(self, node):
+		yield node.left_node
+		yield node.right_node
 
-		return res.success(None)
+	def visit_UnaryOpNode(self, node):
+		yield node.node
+
+	def visit_IfNode(self, node):
+		for condition, expr in node.cases:
+			yield condition
+			yield expr
+
+		if node.else_case:
+			yield node.else_case
+
+	def visit_ForNode(self, node):
+		node.slot = self.slot(node.var_name_tok.value)
+		yield node.start_value_node
+		yield node.end_value_node
+		if node.step_value_node:
+			yield node.step_value_node
+		yield node.body_node
+
+	def visit_WhileNode(self, node):
+		yield node.condition_node
+		yield node.body_node
+
+class Compiler:
+	# Turns an AST into a tree of closures. Every node is dispatched once, at
+	# compile time; running the result only calls the pre-bound closures, each
+	# of which takes the context and returns a (value, error) pair.
+	def compile(self, node):
+		method_name = f'compile_{type(node).__name__}'
+		method = getattr(self, method_name, self.no_compile_method)
+		return method(node)
+
+	def no_compile_method(self, node):
+		raise Exception(f'No compile_{type(node).__name__} method defined')
+
+	def compile_NumberNode(self, node):
+		value = make_number(node.tok.value)
+
+		def number(context):
+			return value, None
+
+		return number
+
+	def compile_StringNode(self, node):
+		value = String(node.tok.value)
+
+		def string(context):
+			return value, None
+
+		return string
+
+	def compile_ProgramNode(self, node):
+		names = node.names
+		body_node = self.compile(node.body_node)
+
+		def program(context):
+			loaded = load_frame(context.symbol_table, names)
+			context.frame = frame = loaded[:]
+
+			try:
+				return body_node(context)
+			finally:
+				store_frame(context.symbol_table, names, frame, loaded)
+
+		return program
+
+	def compile_VarAccessNode(self, node):
+		var_name = node.var_name_tok.value
+		slot = node.slot
+		pos_start, pos_end = node.pos_start, node.pos_end
+
+		def var_access(context):
+			value = context.frame[slot]
+
+			if value is None:
+				return None, RTError(
+					Position(pos_start, context.source), Position(pos_end, context.source),
+					f"'{var_name}' is not defined",
+					context
+				)
 
-global_symbol_table = SymbolTable()
-global_symbol_table.set("NULL", Number(0))
-global_symbol_table.set("FALSE", Number(0))
-global_symbol_table.set("TRUE", Number(1))
+			return value, None
 
-def run(fn, text):
-	# Generate tokens
+		return var_access
+
+	def compile_VarAssignNode(self, node):
+		slot = node.slot
+		value_node = self.compile(node.value_node)
+
+		def var_assign(context):
+			value, error = value_node(context)
+			if error: return None, error
+
+			context.frame[slot] = value
+			return value, None
+
+		return var_assign
+
+	def compile_BinOpNode(self, node):
+		left_node = self.compile(node.left_node)
+		right_node = self.compile(node.right_node)
+		op = BINARY_OPS.get(node.op_tok.type) or BINARY_OPS[(node.op_tok.type, node.op_tok.value)]
+		pos_start, pos_end, right_start = node.pos_start, node.pos_end, node.right_node.pos_start
+
+		def bin_op(context):
+			left, error = left_node(context)
+			if error: return None, error
+			right, error = right_node(context)
+			if error: return None, error
+
+			result, error = getattr(left, op)(right)
+			if error: return None, error.at(pos_start, pos_end, right_start, context)
+			return result, None
+
+		return bin_op
+
+	def compile_UnaryOpNode(self, node):
+		operand = self.compile(node.node)
+		op_tok = node.op_tok
+		pos_start, pos_end, operand_start = node.pos_start, node.pos_end, node.node.pos_start
+
+		def unary_op(context):
+			number, error = operand(context)
+			if error: return None, error
+
+			if op_tok.type == t_MINUS:
+				number, error = number.multed_by(MINUS_ONE)
+			elif op_tok.matches(t_KEYWORD, 'NOT'):
+				number, error = number.notted()
+
+			if error: return None, error.at(pos_start, pos_end, operand_start, context)
+			return number, None
+
+		return unary_op
+
+	def compile_IfNode(self, node):
+		cases = [(self.compile(condition), self.compile(expr)) for condition, expr in node.cases]
+		else_case = self.compile(node.else_case) if node.else_case else None
+
+		def if_expr(context):
+			for condition, expr in cases:
+				condition_value, error = condition(context)
+				if error: return None, error
+
+				if condition_value.is_true():
+					return expr(context)
+
+			if else_case:
+				return else_case(context)
+
+			return None, None
+
+		return if_expr
+
+	def compile_ForNode(self, node):
+		slot = node.slot
+		start_value_node = self.compile(node.start_value_node)
+		end_value_node = self.compile(node.end_value_node)
+		step_value_node = self.compile(node.step_value_node) if node.step_value_node else None
+		body_node = self.compile(node.body_node)
+
+		def for_expr(context):
+			start_value, error = start_value_node(context)
+			if error: return None, error
+
+			end_value, error = end_value_node(context)
+			if error: return None, error
+
+			if step_value_node:
+				step_value, error = step_value_node(context)
+				if error: return None, error
+			else:
+				step_value = TRUE
+
+			i = start_value.value
+			step = step_value.value
+			up = step >= 0
+			end = end_value.value
+			plan = for_range(i, end, step)
+			frame = context.frame
+
+			if plan is not None:
+				for i in plan:
+					frame[slot] = make_number(i)
+					_, error = body_node(context)
+					if error: return None, error
+			elif up:
+				while i < end:
+					frame[slot] = make_number(i)
+					i += step
+
+					_, error = body_node(context)
+					if error: return None, error
+			else:
+				while i > end:
+					frame[slot] = make_number(i)
+					i += step
+
+					_, error = body_node(context)
+					if error: return None, error
+
+			return None, None
+
+		return for_expr
+
+	def compile_WhileNode(self, node):
+		condition_node = self.compile(node.condition_node)
+		body_node = self.compile(node.body_node)
+
+		def while_expr(context):
+			while True:
+				condition, error = condition_node(context)
+				if error: return None, error
+
+				if not condition.is_true(): break
+
+				_, error = body_node(context)
+				if error: return None, error
+
+			return None, None
+
+		return while_expr
+
+OP_CONST			= 0
+OP_LOAD_NONE		= 1
+OP_LOAD_NAME		= 2
+OP_STORE_NAME		= 3
+OP_STORE_NAME_POP	= 4
+OP_POP				= 5
+OP_JUMP				= 6
+OP_JUMP_IF_FALSE	= 7
+OP_FOR_PREP			= 8
+OP_FOR_ITER			= 9
+OP_NEG				= 10
+OP_ADD				= 11
+OP_SUB				= 12
+OP_MUL				= 13
+OP_DIV				= 14
+OP_POW				= 15
+OP_EE				= 16
+OP_NE				= 17
+OP_LT				= 18
+OP_GT				= 19
+OP_LTE				= 20
+OP_GTE				= 21
+OP_AND				= 22
+OP_OR				= 23
+
+OPCODE_NAMES = [
+	'CONST', 'LOAD_NONE', 'LOAD_NAME', 'STORE_NAME', 'STORE_NAME_POP', 'POP',
+	'JUMP', 'JUMP_IF_FALSE', 'FOR_PREP', 'FOR_ITER', 'NEG',
+	'ADD', 'SUB', 'MUL', 'DIV', 'POW', 'EE', 'NE', 'LT', 'GT', 'LTE', 'GTE', 'AND', 'OR'
+]
+
+BINARY_OPCODES = {
+	t_PLUS: OP_ADD,
+	t_MINUS: OP_SUB,
+	t_MUL: OP_MUL,
+	t_DIV: OP_DIV,
+	t_POW: OP_POW,
+	t_EE: OP_EE,
+	t_NE: OP_NE,
+	t_LT: OP_LT,
+	t_GT: OP_GT,
+	t_LTE: OP_LTE,
+	t_GTE: OP_GTE,
+	(t_KEYWORD, 'AND'): OP_AND,
+	(t_KEYWORD, 'OR'): OP_OR
+}
+
+class Bytecode:
+	# Instructions are stored flat as [op, arg, op, arg, ...]; spans holds the
+	# (pos_start, pos_end, operand_start) of the node each instruction came
+	# from, indexed by pc // 2. Constants are kept as ready-made values.
+	def __init__(self):
+		self.code = []
+		self.consts = []
+		self.names = []
+		self.spans = []
+		self.const_index = {}
+		self.name_index = {}
+
+	def emit(self, op, arg=0, node=None, operand=None):
+		self.code.append(op)
+		self.code.append(arg)
+		self.spans.append((
+			node.pos_start if node else None,
+			node.pos_end if node else None,
+			operand.pos_start if operand else None
+		))
+		return len(self.code) - 2
+
+	def patch(self, pc, arg):
+		self.code[pc + 1] = arg
+
+	def add_const(self, value):
+		# Keyed by value, but apart by type (1, 1.0) and sign of zero (0.0,
+		# -0.0); not by repr, which fails on ints past Python's digit limit
+		if type(value) is float:
+			key = (float, value.hex())
+		elif type(value) is complex:
+			key = (complex, value.real.hex(), value.imag.hex())
+		else:
+			key = (type(value), value)
+		if key not in self.const_index:
+			self.const_index[key] = len(self.consts)
+			self.consts.append(String(value) if type(value) is str else make_number(value))
+		return self.const_index[key]
+
+	def dump(self):
+		# Plain lists and tuples only, for marshal
+		return self.code, [const.value for const in self.consts], self.names, self.spans
+
+	def load(self, records):
+		code, consts, names, spans = records
+		self.code = list(code)
+		self.spans = [tuple(span) for span in spans]
+		for value in consts: self.add_const(value)
+		for name in names: self.add_name(name)
+		return self
+
+	def add_name(self, name):
+		if name not in self.name_index:
+			self.name_index[name] = len(self.names)
+			self.names.append(name)
+		return self.name_index[name]
+
+	def disassemble(self):
+		lines = []
+
+		for pc in range(0, len(self.code), 2):
+			op, arg = self.code[pc], self.code[pc + 1]
+			line = f'{pc:>6} {OPCODE_NAMES[op]:<16}'
+
+			if op == OP_CONST:
+				line += f'{arg:>4} ({self.consts[arg]!r})'
+			elif op in (OP_LOAD_NAME, OP_STORE_NAME, OP_STORE_NAME_POP):
+				line += f'{arg:>4} ({self.names[arg]})'
+			elif op in (OP_JUMP, OP_JUMP_IF_FALSE, OP_FOR_ITER):
+				line += f'{arg:>4}'
+			elif op == OP_FOR_PREP:
+				line += f'{arg:>4} ({"step" if arg else "no step"})'
+
+			lines.append(line.rstrip())
+
+		return '\n'.join(lines)
+
+class BytecodeCompiler:
+	# visit_ methods yield the child nodes they need compiled in between their
+	# own instructions; see walk
+	def compile(self, node):
+		bytecode = Bytecode()
+		walk(self, node, bytecode)
+		return bytecode
+
+	def visit(self, node, bytecode):
+		method_name = f'visit_{type(node).__name__}'
+		method = getattr(self, method_name, self.no_visit_method)
+		return method(node, bytecode)
+
+	def no_visit_method(self, node, bytecode):
+		raise Exception(f'No visit_{type(node).__name__} method defined')
+
+	def visit_NumberNode(self, node, bytecode):
+		bytecode.emit(OP_CONST, bytecode.add_const(node.tok.value), node)
+
+	def visit_StringNode(self, node, bytecode):
+		bytecode.emit(OP_CONST, bytecode.add_const(node.tok.value), node)
+
+	def visit_VarAccessNode(self, node, bytecode):
+		bytecode.emit(OP_LOAD_NAME, bytecode.add_name(node.var_name_tok.value), node)
+
+	def visit_VarAssignNode(self, node, bytecode):
+		yield node.value_node
+		bytecode.emit(OP_STORE_NAME, bytecode.add_name(node.var_name_tok.value), node)
+
+	def visit_BinOpNode(self, node, bytecode):
+		yield node.left_node
+		yield node.right_node
+		op = BINARY_OPCODES.get(node.op_tok.type) or BINARY_OPCODES[(node.op_tok.type, node.op_tok.value)]
+		bytecode.emit(op, 0, node, node.right_node)
+
+	def visit_UnaryOpNode(self, node, bytecode):
+		yield node.node
+		# Unary plus leaves its operand as it is
+		if node.op_tok.type == t_MINUS:
+			bytecode.emit(OP_NEG, 0, node, node.node)
+
+	def visit_IfNode(self, node, bytecode):
+		end_jumps = []
+
+		for condition, expr in node.cases:
+			yield condition
+			next_case = bytecode.emit(OP_JUMP_IF_FALSE)
+			yield expr
+			end_jumps.append(bytecode.emit(OP_JUMP))
+			bytecode.patch(next_case, len(bytecode.code))
+
+		if node.else_case:
+			yield node.else_case
+		else:
+			bytecode.emit(OP_LOAD_NONE)
+
+		for jump in end_jumps:
+			bytecode.patch(jump, len(bytecode.code))
+
+	def visit_ForNode(self, node, bytecode):
+		yield node.start_value_node
+		yield node.end_value_node
+		if node.step_value_node:
+			yield node.step_value_node
+
+		bytecode.emit(OP_FOR_PREP, 1 if node.step_value_node else 0, node)
+		loop_start = bytecode.emit(OP_FOR_ITER, 0, node)
+		bytecode.emit(OP_STORE_NAME_POP, bytecode.add_name(node.var_name_tok.value), node)
+		yield node.body_node
+		bytecode.emit(OP_POP)
+		bytecode.emit(OP_JUMP, loop_start)
+		bytecode.patch(loop_start, len(bytecode.code))
+		bytecode.emit(OP_LOAD_NONE)
+
+	def visit_WhileNode(self, node, bytecode):
+		loop_start = len(bytecode.code)
+		yield node.condition_node
+		loop_exit = bytecode.emit(OP_JUMP_IF_FALSE)
+		yield node.body_node
+		bytecode.emit(OP_POP)
+		bytecode.emit(OP_JUMP, loop_start)
+		bytecode.patch(loop_exit, len(bytecode.code))
+		bytecode.emit(OP_LOAD_NONE)
+
+class VM:
+	# Name indexes double as slots: the bytecode compiler gives each name one
+	def run(self, bytecode, context):
+		loaded = load_frame(context.symbol_table, bytecode.names)
+		context.frame = frame = loaded[:]
+
+		try:
+			return self.execute(bytecode, context, frame)
+		finally:
+			store_frame(context.symbol_table, bytecode.names, frame, loaded)
+
+	def execute(self, bytecode, context, frame):
+		code = bytecode.code
+		consts = bytecode.consts
+		names = bytecode.names
+		spans = bytecode.spans
+		stack = []
+		push = stack.append
+		pop = stack.pop
+		pc = 0
+		code_end = len(code)
+
+		while pc < code_end:
+			op = code[pc]
+
+			if op >= OP_ADD:
+				right = pop()
+				left = stack[-1]
+
+				if op == OP_ADD: result, error = left.added_to(right)
+				elif op == OP_SUB: result, error = left.subbed_by(right)
+				elif op == OP_MUL: result, error = left.multed_by(right)
+				elif op == OP_LT: result, error = left.get_comparison_lt(right)
+				elif op == OP_GT: result, error = left.get_comparison_gt(right)
+				elif op == OP_DIV: result, error = left.dived_by(right)
+				elif op == OP_POW: result, error = left.powed_by(right)
+				elif op == OP_EE: result, error = left.get_comparison_eq(right)
+				elif op == OP_NE: result, error = left.get_comparison_ne(right)
+				elif op == OP_LTE: result, error = left.get_comparison_lte(right)
+				elif op == OP_GTE: result, error = left.get_comparison_gte(right)
+				elif op == OP_AND: result, error = left.anded_by(right)
+				else: result, error = left.ored_by(right)
+
+				if error: return None, error.at(*spans[pc >> 1], context)
+				stack[-1] = result
+
+			elif op == OP_LOAD_NAME:
+				value = frame[code[pc + 1]]
+
+				if value is None:
+					pos_start, pos_end, _ = spans[pc >> 1]
+					return None, RTError(
+						Position(pos_start, context.source), Position(pos_end, context.source),
+						f"'{names[code[pc + 1]]}' is not defined",
+						context
+					)
+
+				push(value)
+
+			elif op == OP_CONST:
+				push(consts[code[pc + 1]])
+
+			elif op == OP_STORE_NAME:
+				frame[code[pc + 1]] = stack[-1]
+
+			elif op == OP_JUMP_IF_FALSE:
+				if not pop().is_true():
+					pc = code[pc + 1]
+					continue
+
+			elif op == OP_JUMP:
+				pc = code[pc + 1]
+				continue
+
+			elif op == OP_POP:
+				pop()
+
+			elif op == OP_FOR_ITER:
+				loop = stack[-1]
+
+				if type(loop) is list:
+					i = loop[0]
+					more = (i < loop[2]) if loop[3] else (i > loop[2])
+					if more: loop[0] = i + loop[1]
+				else:
+					i = next(loop, None)
+					more = i is not None
+
+				if more:
+					push(make_number(i))
+				else:
+					pop()
+					pc = code[pc + 1]
+					continue
+
+			elif op == OP_STORE_NAME_POP:
+				frame[code[pc + 1]] = pop()
+
+			elif op == OP_LOAD_NONE:
+				push(None)
+
+			elif op == OP_FOR_PREP:
+				step_value = pop() if code[pc + 1] else TRUE
+				end_value = pop()
+				i = pop().value
+				step = step_value.value
+				up = step >= 0
+				end = end_value.value
+				plan = for_range(i, end, step)
+				# An iterator over the plan, or [next i, step, end, counting up]
+				push(iter(plan) if plan is not None else [i, step, end, up])
+
+			elif op == OP_NEG:
+				number, error = pop().multed_by(MINUS_ONE)
+				if error: return None, error.at(*spans[pc >> 1], context)
+				push(number)
+
+			pc += 2
+
+		return pop(), None
+
+class ProgramCache:
+	# Least recently used map from (text, engine, optimize) to the ready-to-run
+	# form of a program: the folded AST, the closure tree or the bytecode. None
+	# of these change while running (values are immutable and every run gets
+	# its own context and VM stack), so one entry can serve any number of runs.
+	# Sizes are counted as the length of the source text, which the cached
+	# forms grow in proportion to.
+	def __init__(self, max_entries=4096, max_bytes=16 * 1024 * 1024):
+		self.max_entries = max_entries
+		self.max_bytes = max_bytes
+		self.entries = OrderedDict()
+		self.bytes = 0
+		self.hits = 0
+		self.misses = 0
+		self.evictions = 0
+		self.lock = threading.Lock()
+
+	def get(self, key):
+		with self.lock:
+			entry = self.entries.get(key)
+			if entry is None:
+				self.misses += 1
+				return None
+
+			self.entries.move_to_end(key)
+			self.hits += 1
+			return entry[0]
+
+	def put(self, key, program, size):
+		with self.lock:
+			if size > self.max_bytes: return
+
+			old = self.entries.pop(key, None)
+			if old: self.bytes -= old[1]
+
+			self.entries[key] = (program, size)
+			self.bytes += size
+
+			self.trim()
+
+	def invalidate(self, text=None):
+		# Drops every entry for text, or the whole cache when no text is given
+		with self.lock:
+			if text is None:
+				self.entries.clear()
+				self.bytes = 0
+				return
+
+			for key in [key for key in self.entries if key[0] == text]:
+				self.bytes -= self.entries.pop(key)[1]
+
+	def resize(self, max_entries=None, max_bytes=None):
+		with self.lock:
+			if max_entries is not None: self.max_entries = max_entries
+			if max_bytes is not None: self.max_bytes = max_bytes
+			self.trim()
+
+	def trim(self):
+		# Callers hold the lock
+		while self.entries and (len(self.entries) > self.max_entries or self.bytes > self.max_bytes):
+			_, (_, evicted_size) = self.entries.popitem(last=False)
+			self.bytes -= evicted_size
+			self.evictions += 1
+
+	def stats(self):
+		with self.lock:
+			return {
+				'entries': len(self.entries),
+				'bytes': self.bytes,
+				'hits': self.hits,
+				'misses': self.misses,
+				'evictions': self.evictions
+			}
+
+NODE_NUMBER			= 0
+NODE_STRING			= 1
+NODE_VAR_ACCESS		= 2
+NODE_VAR_ASSIGN		= 3
+NODE_BIN_OP			= 4
+NODE_UNARY_OP		= 5
+NODE_IF				= 6
+NODE_FOR			= 7
+NODE_WHILE			= 8
+
+class ASTSerializer:
+	# Flattens an AST into a postfix list of plain tuples that marshal can
+	# store. dump walks the tree and load rebuilds it with explicit stacks, so
+	# deep trees are fine. Every node gets back the exact tokens, and so the
+	# exact offsets, it had.
+	def dump(self, node):
+		records = []
+		walk(self, node, records)
+		return records
+
+	def visit(self, node, records):
+		method_name = f'visit_{type(node).__name__}'
+		method = getattr(self, method_name, self.no_visit_method)
+		return method(node, records)
+
+	def no_visit_method(self, node, records):
+		raise Exception(f'No visit_{type(node).__name__} method defined')
+
+	def visit_NumberNode(self, node, records):
+		tok = node.tok
+		records.append((NODE_NUMBER, tok.type, tok.value, tok.pos_start, tok.pos_end))
+
+	def visit_StringNode(self, node, records):
+		tok = node.tok
+		records.append((NODE_STRING, tok.type, tok.value, tok.pos_start, tok.pos_end))
+
+	def visit_VarAccessNode(self, node, records):
+		tok = node.var_name_tok
+		records.append((NODE_VAR_ACCESS, tok.type, tok.value, tok.pos_start, tok.pos_end))
+
+	def visit_VarAssignNode(self, node, records):
+		yield node.value_node
+		tok = node.var_name_tok
+		records.append((NODE_VAR_ASSIGN, tok.type, tok.value, tok.pos_start, tok.pos_end))
+
+	def visit_BinOpNode(self, node, records):
+		yield node.left_node
+		yield node.right_node
+		tok = node.op_tok
+		records.append((NODE_BIN_OP, tok.type, tok.value, tok.pos_start, tok.pos_end))
+
+	def visit_UnaryOpNode(self, node, records):
+		yield node.node
+		tok = node.op_tok
+		records.append((NODE_UNARY_OP, tok.type, tok.value, tok.pos_start, tok.pos_end))
+
+	def visit_IfNode(self, node, records):
+		for condition, expr in node.cases:
+			yield condition
+			yield expr
+		if node.else_case:
+			yield node.else_case
+		records.append((NODE_IF, len(node.cases), node.else_case is not None))
+
+	def visit_ForNode(self, node, records):
+		yield node.start_value_node
+		yield node.end_value_node
+		if node.step_value_node:
+			yield node.step_value_node
+		yield node.body_node
+		tok = node.var_name_tok
+		records.append((NODE_FOR, tok.type, tok.value, tok.pos_start, tok.pos_end, node.step_value_node is not None))
+
+	def visit_WhileNode(self, node, records):
+		yield node.condition_node
+		yield node.body_node
+		records.append((NODE_WHILE,))
+
+	def load(self, records):
+		stack = []
+		push = stack.append
+		pop = stack.pop
+
+		for record in records:
+			kind = record[0]
+
+			if kind == NODE_NUMBER:
+				push(NumberNode(Token(*record[1:5])))
+			elif kind == NODE_STRING:
+				push(StringNode(Token(*record[1:5])))
+			elif kind == NODE_VAR_ACCESS:
+				push(VarAccessNode(Token(*record[1:5])))
+			elif kind == NODE_VAR_ASSIGN:
+				push(VarAssignNode(Token(*record[1:5]), pop()))
+			elif kind == NODE_BIN_OP:
+				right_node = pop()
+				push(BinOpNode(pop(), Token(*record[1:5]), right_node))
+			elif kind == NODE_UNARY_OP:
+				push(UnaryOpNode(Token(*record[1:5]), pop()))
+			elif kind == NODE_IF:
+				_, case_count, has_else = record
+				else_case = pop() if has_else else None
+				cases = stack[-2 * case_count:]
+				del stack[-2 * case_count:]
+				push(IfNode([(cases[i], cases[i + 1]) for i in range(0, len(cases), 2)], else_case))
+			elif kind == NODE_FOR:
+				body_node = pop()
+				step_value_node = pop() if record[5] else None
+				end_value_node = pop()
+				push(ForNode(Token(*record[1:5]), pop(), end_value_node, step_value_node, body_node))
+			elif kind == NODE_WHILE:
+				body_node = pop()
+				push(WhileNode(pop(), body_node))
+			else:
+				raise Exception(f'No AST record kind {kind} defined')
+
+		if len(stack) != 1: raise Exception('Malformed AST records')
+		return stack[0]
+
+# Bump whenever the layout written by DiskCache changes
+CACHE_FORMAT = 1
+
+def calc_stamp():
+	# Ties cached files to this exact calc.py, like the magic number of a .pyc
+	hasher = hashlib.sha256(f'calc cache format {CACHE_FORMAT}'.encode())
+	try:
+		with open(__file__, 'rb') as f:
+			hasher.update(f.read())
+	except (NameError, OSError):
+		pass
+	return hasher.digest()[:16]
+
+class DiskCache:
+	# One file per (text, form, optimize) in directory, named after their hash,
+	# where form is the bytecode for the VM and the AST for the other engines.
+	# A file holds MAGIC, the calc.py stamp, a digest of the payload and the
+	# marshalled records. Anything that does not match is ignored and
+	# rewritten; files are written to a temporary name and renamed into place,
+	# so readers in other processes never see half a file.
+	MAGIC = b'CALC'
+	stamp = None
+
+	def __init__(self, directory):
+		self.directory = directory
+		if DiskCache.stamp is None:
+			DiskCache.stamp = calc_stamp()
+
+	def form(self, engine):
+		return 'bytecode' if engine == 'vm' else 'ast'
+
+	def path(self, text, form, optimize):
+		# A mapped file hashes the same as its decoded text, but positions in a
+		# program lexed from bytes are byte offsets, so the unit is in the key
+		unit = 'str' if isinstance(text, str) else 'bytes'
+		key = hashlib.sha256(text.encode('utf-8', 'surrogatepass') if isinstance(text, str) else text)
+		key.update(f'\0{form}\0{int(optimize)}\0{unit}'.encode())
+		return os.path.join(self.directory, key.hexdigest() + '.calcc')
+
+	def load(self, text, engine, optimize):
+		# The node, or the Bytecode for the VM; None when there is no usable file
+		form = self.form(engine)
+
+		try:
+			with open(self.path(text, form, optimize), 'rb') as f:
+				data = f.read()
+		except OSError:
+			return None
+
+		header_size = len(self.MAGIC) + 32
+		if len(data) < header_size or not data.startswith(self.MAGIC): return None
+		if data[len(self.MAGIC):len(self.MAGIC) + 16] != self.stamp: return None
+
+		payload = data[header_size:]
+		if hashlib.sha256(payload).digest()[:16] != data[len(self.MAGIC) + 16:header_size]: return None
+
+		try:
+			with GCPaused():
+				records = marshal.loads(payload)
+				if form == 'bytecode': return Bytecode().load(records)
+				return ASTSerializer().load(records)
+		except Exception:
+			return None
+
+	def store(self, text, engine, optimize, program):
+		form = self.form(engine)
+
+		try:
+			records = program.dump() if form == 'bytecode' else ASTSerializer().dump(program)
+			payload = marshal.dumps(records)
+		except (ValueError, RecursionError):
+			return
+
+		data = self.MAGIC + self.stamp + hashlib.sha256(payload).digest()[:16] + payload
+
+		try:
+			os.makedirs(self.directory, exist_ok=True)
+			fd, tmp_path = tempfile.mkstemp(dir=self.directory, prefix='.tmp-', suffix='.calcc')
+		except OSError:
+			return
+
+		try:
+			with os.fdopen(fd, 'wb') as f:
+				f.write(data)
+			os.replace(tmp_path, self.path(text, form, optimize))
+		except OSError:
+			try:
+				os.unlink(tmp_path)
+			except OSError:
+				pass
+
+# Never written by programs: every session's table sits on top of it
+builtin_symbol_table = SymbolTable()
+builtin_symbol_table.set("NULL", FALSE)
+builtin_symbol_table.set("FALSE", FALSE)
+builtin_symbol_table.set("TRUE", TRUE)
+
+global_symbol_table = SymbolTable(builtin_symbol_table)
+
+program_cache = ProgramCache()
+
+def compile_node(node, engine):
+	if engine == 'closure':
+		return Compiler().compile(Resolver().resolve(node))
+	elif engine == 'vm':
+		return BytecodeCompiler().compile(node)
+	elif engine != 'interpreter':
+		raise Exception(f"No '{engine}' engine defined")
+
+	return Resolver().resolve(node)
+
+def compile_program(fn, text, engine='interpreter', optimize=True, disk_cache=None):
+	if disk_cache:
+		program = disk_cache.load(text, engine, optimize)
+		if program is not None:
+			return (program if engine == 'vm' else compile_node(program, engine)), None
+
+	# Generate tokens; a buffer is lexed as the parser goes
 	lexer = Lexer(fn, text)
-	tokens, error = lexer.make_tokens()
-	if error: return None, error
+	if isinstance(text, str):
+		tokens, error = lexer.make_tokens()
+		if error: return None, error
+	else:
+		tokens = lexer.iter_tokens()
 	
 	# Generate AST
-	parser = Parser(tokens)
+	parser = Parser(tokens, lexer.source)
 	ast = parser.parse()
+
+	if lexer.error is None and ast.error and not isinstance(tokens, list):
+		# A lexing error anywhere wins over a syntax error, as if every token
+		# had been made first
+		for _ in tokens: pass
+	if lexer.error: return None, lexer.error
 	if ast.error: return None, ast.error
 
-	# Run program
-	interpreter = Interpreter()
+	# Fold constants
+	node = ast.node
+	if optimize:
+		node = Optimizer().optimize(node)
+
+	program = compile_node(node, engine)
+	if disk_cache: disk_cache.store(text, engine, optimize, program if engine == 'vm' else node)
+	return program, None
+
+class Session:
+	# Variables shared by the programs run in it, and how they are run. A new
+	# session's table is empty on top of the builtins (or of symbol_table's
+	# parents), so creating one copies nothing and assigning only ever writes
+	# to its own table. Programs compile concurrently, but one session runs
+	# one program at a time; separate sessions run side by side
+	def __init__(self, symbol_table=None, engine='interpreter', optimize=True, cache=program_cache, disk_cache=None):
+		self.symbol_table = symbol_table if symbol_table is not None else SymbolTable(builtin_symbol_table)
+		self.engine = engine
+		self.optimize = optimize
+		self.cache = cache
+		self.disk_cache = disk_cache
+		self.lock = threading.Lock()
+		# Totals of the interpreter's inline caches over the session's runs
+		self.inline_cache_stats = {'nodes': 0, 'quickened': 0, 'hits': 0, 'misses': 0}
+
+	def variables(self):
+		# Every name visible to the session's programs apart from the builtins,
+		# parents first so nearer tables win
+		tables = []
+		symbol_table = self.symbol_table
+		while symbol_table and symbol_table is not builtin_symbol_table:
+			tables.append(symbol_table)
+			symbol_table = symbol_table.parent
+
+		symbols = {}
+		for symbol_table in reversed(tables):
+			symbols.update(symbol_table.symbols)
+		return symbols
+
+	def run(self, fn, text, engine=None, optimize=None, cache=True, disk_cache=None, profile=None, budget=None):
+		# engine, optimize and disk_cache default to the session's own;
+		# cache=False skips the program cache for this run. A Profile records
+		# where the run spends its time, and a Budget limits it; both need the
+		# interpreter, and not both at once
+		engine = engine or self.engine
+		if profile is not None and engine != 'interpreter':
+			raise Exception(f"No profiling with the '{engine}' engine, only with 'interpreter'")
+		if budget is not None and engine != 'interpreter':
+			raise Exception(f"No budgets with the '{engine}' engine, only with 'interpreter'")
+		if profile is not None and budget is not None:
+			raise Exception('No profiling of a run with a budget')
+		optimize = self.optimize if optimize is None else optimize
+		cache = self.cache if cache else None
+		disk_cache = disk_cache or self.disk_cache
+
+		# Programs that fail to lex or parse are not cached: their errors point
+		# into this fn, while cached programs only hold offsets. Nor are mapped
+		# files, which are too big to be keys
+		if not isinstance(text, str): cache = None
+		key = (text, engine, optimize)
+		program = cache.get(key) if cache is not None else None
+
+		context = Context('<program>')
+		context.symbol_table = self.symbol_table
+		context.source = Source(fn, text)
+
+		# The interpreter and the closure engine recurse once per level of
+		# nesting (the closure engine when compiling too), so a program nested
+		# deeper than Python's recursion limit is an error there. The VM runs
+		# on a stack of its own and is the engine for such programs
+		try:
+			if program is None:
+				program, error = compile_program(fn, text, engine, optimize, disk_cache)
+				if error: return None, error
+				if cache is not None: cache.put(key, program, len(text))
+
+			# Run program
+			with self.lock:
+				if engine == 'closure':
+					return program(context)
+				elif engine == 'vm':
+					return VM().run(program, context)
+
+				if profile is not None:
+					interpreter = ProfilingInterpreter(profile)
+				elif budget is not None:
+					interpreter = BudgetedInterpreter(budget)
+				else:
+					interpreter = Interpreter()
+
+				try:
+					return interpreter.visit(program, context), None
+				except Failure as failure:
+					return None, failure.error
+				finally:
+					interpreter.inline_cache_stats(self.inline_cache_stats)
+		except RecursionError:
+			return None, RTError(
+				Position(0, context.source), Position(len(text), context.source),
+				f"Too deeply nested for the '{engine}' engine, run it with the 'vm' engine",
+				context
+			)
+
+default_session = Session(global_symbol_table)
+
+def run(fn, text, engine='interpreter', optimize=True, cache=True, disk_cache=None, profile=None, budget=None):
+	return default_session.run(fn, text, engine, optimize, cache, disk_cache, profile, budget)
+
+def map_file(file):
+	# The contents of a path or file object, memory-mapped when it is a real
+	# file, for compile_program and run to lex in place
+	if isinstance(file, (str, os.PathLike)):
+		with open(file, 'rb') as f:
+			return map_file(f)
+
+	try:
+		fileno = file.fileno()
+	except (AttributeError, OSError, ValueError):
+		return file.read()
+
+	if os.fstat(fileno).st_size == 0: return b''
+	return mmap.mmap(fileno, 0, access=mmap.ACCESS_READ)
+
+def run_file(path, engine='interpreter', optimize=True, cache_dir=None):
+	# Runs a script file, lexed straight from a memory map of it; with
+	# cache_dir, its parsed form is kept on disk so other processes running
+	# the same script can skip lexing and parsing
+	return run(path, map_file(path), engine, optimize, disk_cache=DiskCache(cache_dir) if cache_dir else None)
+
+# Symbols every program run by this worker process starts from
+worker_symbols = None
+
+def init_worker(symbols):
+	global worker_symbols
+	worker_symbols = symbols
+
+def run_chunk(chunk, engine, optimize):
+	# Runs in a worker. Each program gets a fresh copy of the worker's symbols,
+	# so results don't depend on which programs shared a worker; the program
+	# cache stays warm across chunks
+	results = []
+
+	for index, fn, text in chunk:
+		global_symbol_table.symbols = dict(worker_symbols)
+		try:
+			value, error = run(fn, text, engine, optimize)
+		except Exception as e:
+			# The engines let some errors through as Python exceptions ('0 ^ -1');
+			# one of them must not take the rest of the results with it
+			source = Source(fn, text)
+			value, error = None, Error(
+				Position(0, source), Position(len(text), source),
+				'Internal Error', f'{type(e).__name__}: {e}'
+			)
+
+		# The error goes back to the parent process without the variables
+		if isinstance(error, RTError):
+			context = error.context
+			while context:
+				context.symbol_table = context.frame = None
+				context = context.parent
+
+		results.append((index, value, error))
+
+	return results
+
+def run_many(programs, engine='interpreter', optimize=True, workers=None, chunk_size=64, ordered=True, session=None):
+	# Runs independent (fn, text) programs on a pool of worker processes, in
+	# chunks of chunk_size, and yields (index, value, error) for each: in input
+	# order, or as chunks finish with ordered=False. Every program starts from
+	# the session's variables (the default session's if none is given) as they
+	# are now; what it assigns is not kept
+	workers = workers or os.cpu_count() or 1
+	programs = ((index, fn, text) for index, (fn, text) in enumerate(programs))
+	symbols = (session or default_session).variables()
+
+	with ProcessPoolExecutor(workers, initializer=init_worker, initargs=(symbols,)) as executor:
+		pending = set()
+		finished = {}
+		next_index = 0
+		more = True
+
+		while True:
+			# A few chunks per worker in flight, so programs can be streamed in
+			while more and len(pending) < workers * 4:
+				chunk = list(islice(programs, chunk_size))
+				if not chunk:
+					more = False
+					break
+				pending.add(executor.submit(run_chunk, chunk, engine, optimize))
+
+			if not pending: break
+			done, pending = wait(pending, return_when=FIRST_COMPLETED)
+
+			for future in done:
+				results = future.result()
+				if not ordered:
+					yield from results
+				else:
+					finished[results[0][0]] = results
+
+			while next_index in finished:
+				results = finished.pop(next_index)
+				next_index += len(results)
+				yield from results
+
+class BatchResult:
+	# values[i] is what row i evaluated to, unless errors[i] holds the RTError
+	# the row stopped at; failed masks the rows that have one
+	def __init__(self, values, errors, failed):
+		self.values = values
+		self.errors = errors
+		self.failed = failed
+
+class BatchEvaluator:
+	# Evaluates one expression for every row of a set of columns at once, with
+	# NumPy operations over whole columns. Numbers are int64 or float64 arrays,
+	# so results follow NumPy where Python would grow an int past 64 bits,
+	# overflow a float or make a complex number. A row that fails keeps the
+	# first error it hits, as running it alone would, without stopping the
+	# others; self.active masks the rows that reach the node being evaluated
+	UNSUPPORTED = {
+		'StringNode': 'Strings',
+		'VarAssignNode': 'VAR',
+		'ForNode': 'FOR',
+		'WhileNode': 'WHILE'
+	}
+
+	def __init__(self, columns, symbol_table, context):
+		import numpy
+		self.np = np = numpy
+
+		self.columns = {}
+		for name, column in columns.items():
+			column = np.asarray(column)
+			if column.ndim != 1 or column.dtype.kind not in 'biuf':
+				raise Exception(f"No numeric column '{name}'")
+			# Narrower and unsigned columns would wrap or round where run does
+			# not, so every number is an int64 or a float64
+			column = column.astype(np.float64 if column.dtype.kind == 'f' else np.int64, copy=False)
+			self.columns[name] = column
+
+		sizes = {len(column) for column in self.columns.values()}
+		if len(sizes) > 1: raise Exception('No common length for the columns')
+		self.size = sizes.pop() if sizes else 1
+
+		self.symbol_table = symbol_table
+		self.context = context
+		self.active = np.ones(self.size, dtype=bool)
+		self.failed = np.zeros(self.size, dtype=bool)
+		self.errors = np.full(self.size, None, dtype=object)
+
+	def check(self, node):
+		# Errors for the whole batch: nodes that have no column-wise form, and
+		# globals that aren't numbers
+		stack = [node]
+
+		while stack:
+			node = stack.pop()
+			kind = type(node).__name__
+
+			if kind in self.UNSUPPORTED or (kind == 'IfNode' and not node.else_case):
+				what = self.UNSUPPORTED.get(kind, 'IF without ELSE')
+				return self.error(node, f'{what} can not be evaluated in a batch')
+			elif kind == 'VarAccessNode':
+				var_name = node.var_name_tok.value
+				if var_name not in self.columns:
+					value = self.symbol_table.get(var_name)
+					if value is not None and not isinstance(value, Number):
+						return self.error(node, f"'{var_name}' is not a number")
+			elif kind == 'BinOpNode':
+				stack.extend((node.right_node, node.left_node))
+			elif kind == 'UnaryOpNode':
+				stack.append(node.node)
+			elif kind == 'IfNode':
+				stack.append(node.else_case)
+				for condition, expr in reversed(node.cases):
+					stack.extend((expr, condition))
+
+		return None
+
+	def evaluate(self, node):
+		error = self.check(node)
+		if error: return None, error
+
+		np = self.np
+		with np.errstate(all='ignore'):
+			values = np.broadcast_to(walk(self, node), (self.size,)).copy()
+
+		return BatchResult(values, self.errors, self.failed), None
+
+	def error(self, node, details):
+		return RTError(
+			Position(node.pos_start, self.context.source), Position(node.pos_end, self.context.source),
+			details,
+			self.context
+		)
+
+	def fail(self, rows, active, error):
+		# Rows that already failed keep their first error
+		rows = rows & active & ~self.failed
+		self.errors[rows] = error
+		self.failed |= rows
+
+	def to_int(self, values):
+		# int() truncates, as AND and OR do to their result
+		if values.dtype.kind == 'f': return self.np.trunc(values).astype(self.np.int64)
+		return values
+
+	def visit(self, node):
+		method_name = f'visit_{type(node).__name__}'
+		method = getattr(self, method_name, self.no_visit_method)
+		return method(node)
+
+	def no_visit_method(self, node):
+		raise Exception(f'No visit_{type(node).__name__} method defined')
+
+	def visit_NumberNode(self, node):
+		return self.np.asarray(node.tok.value)
+
+	def visit_VarAccessNode(self, node):
+		np = self.np
+		var_name = node.var_name_tok.value
+		if var_name in self.columns: return self.columns[var_name]
+
+		value = self.symbol_table.get(var_name)
+		if value is None:
+			self.fail(True, self.active, self.error(node, f"'{var_name}' is not defined"))
+			return np.asarray(0)
+
+		return np.asarray(value.value)
+
+	def visit_BinOpNode(self, node):
+		np = self.np
+		active = self.active
+		left = yield node.left_node
+		right = yield node.right_node
+		op = BINARY_OPS.get(node.op_tok.type) or BINARY_OPS[(node.op_tok.type, node.op_tok.value)]
+
+		if op == 'added_to': return left + right
+		elif op == 'subbed_by': return left - right
+		elif op == 'multed_by': return left * right
+		elif op == 'dived_by':
+			zero = right == 0
+			if zero.any():
+				self.fail(zero, active, DIVISION_BY_ZERO.at(node.pos_start, node.pos_end, node.right_node.pos_start, self.context))
+				right = np.where(zero, 1, right)
+			return np.true_divide(left, right)
+		elif op == 'powed_by':
+			# NumPy refuses negative powers of ints; Python gives a float
+			if left.dtype.kind in 'iu' and right.dtype.kind in 'iu' and (right < 0).any():
+				left = left.astype(np.float64)
+			return np.power(left, right)
+		elif op == 'get_comparison_eq': return (left == right).astype(np.int64)
+		elif op == 'get_comparison_ne': return (left != right).astype(np.int64)
+		elif op == 'get_comparison_lt': return (left < right).astype(np.int64)
+		elif op == 'get_comparison_gt': return (left > right).astype(np.int64)
+		elif op == 'get_comparison_lte': return (left <= right).astype(np.int64)
+		elif op == 'get_comparison_gte': return (left >= right).astype(np.int64)
+		elif op == 'anded_by': return np.where(left != 0, self.to_int(right), 0)
+		else: return np.where(left != 0, self.to_int(left), self.to_int(right))
+
+	def visit_UnaryOpNode(self, node):
+		value = yield node.node
+
+		if node.op_tok.type == t_MINUS:
+			return -value
+		elif node.op_tok.matches(t_KEYWORD, 'NOT'):
+			return (value == 0).astype(self.np.int64)
+
+		return value
+
+	def visit_IfNode(self, node):
+		# Each case only runs, and can only fail, for the rows that reach it
+		active = remaining = self.active
+		taken, values = [], []
+
+		for condition, expr in node.cases:
+			self.active = remaining
+			condition = yield condition
+			self.active = remaining & (condition != 0)
+			value = yield expr
+
+			taken.append(self.active)
+			values.append(value)
+			remaining = remaining & ~self.active
+
+		self.active = remaining
+		else_value = yield node.else_case
+		self.active = active
+
+		shape = (self.size,)
+		values = [self.np.broadcast_to(value, shape) for value in values]
+		return self.np.select(taken, values, self.np.broadcast_to(else_value, shape))
+
+def eval_batch(fn, text, columns, optimize=True, session=None):
+	# Evaluates text once per row of columns, a dict of equally long NumPy
+	# arrays (or sequences) by variable name, at NumPy speed. Other names are
+	# read from the session (the default one if none is given). Returns
+	# (BatchResult, error), where error is a lex or parse error, or a reason
+	# the whole text can't be evaluated column-wise
+	program, error = compile_program(fn, text, 'interpreter', optimize)
+	if error: return None, error
+
+	symbol_table = (session or default_session).symbol_table
 	context = Context('<program>')
-	context.symbol_table = global_symbol_table
-	result = interpreter.visit(ast.node, context)
+	context.symbol_table = symbol_table
+	context.source = Source(fn, text)
 
-	return result.value, result.error
\ No newline at end of file
+	return BatchEvaluator(columns, symbol_table, context).evaluate(program.body_node)
@@ -0,0 +1,248 @@
+# Servidor asyncio: un objeto JSON por linea, por TCP o por un socket Unix
+# python3 server.py [puerto | ruta del socket] [procesos] [timeout]
+#
+# Request:  {"id": 1, "text": "x * 2", "variables": {"x": 21}, "engine": "vm", "timeout": 0.5}
+# Response: {"id": 1, "value": 42, "error": null}
+#
+# Only "text" is required. Requests on one connection are evaluated
+# concurrently and answered as they finish, so a client matches responses to
+# requests by "id". Every request runs in a fresh session, in a worker process
+# that is killed and replaced if it runs past its timeout.
+
+import asyncio
+import json
+import math
+import multiprocessing
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
+
+import calc
+
+# Workers are started from threads, where forking the server itself is unsafe
+START_METHOD = 'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+
+def encode(value, error):
+	if error: return None, error.as_string()
+	if value is None: return None, None
+
+	value = value.value
+	# JSON has no complex numbers ('(0 - 8) ^ 0.5'), infinities or NaN, and
+	# Python will not write ints past its digit limit ('10 ^ 5000')
+	if type(value) is complex or type(value) is float and not math.isfinite(value):
+		return None, f'Invalid result: {value} has no JSON representation'
+	limit = sys.get_int_max_str_digits()
+	if type(value) is int and limit and value.bit_length() > limit * 3 and abs(value) >= 10 ** limit:
+		return None, f'Invalid result: an integer of more than {limit} digits has no JSON representation'
+	return value, None
+
+def reject_constant(name):
+	raise ValueError(f'{name} is not valid JSON')
+
+def request_id(line):
+	# The id of a request line if it has one, to answer it however it failed
+	try:
+		request = json.loads(line, parse_constant=reject_constant)
+	except ValueError:
+		return None
+	return request.get('id') if isinstance(request, dict) else None
+
+def evaluate(request):
+	session = calc.Session(engine=request.get('engine', 'vm'))
+
+	for name, value in request.get('variables', {}).items():
+		if isinstance(value, str):
+			session.symbol_table.set(name, calc.String(value))
+		elif isinstance(value, (int, float)) and not isinstance(value, bool):
+			session.symbol_table.set(name, calc.make_number(value))
+		else:
+			return None, f"Invalid request: variable '{name}' is not a number or a string"
+
+	try:
+		return encode(*session.run('<request>', request['text']))
+	except Exception as e:
+		# The engines let some errors through as Python exceptions
+		return None, f'Internal error: {type(e).__name__}: {e}'
+
+def worker_main(conn):
+	while True:
+		try:
+			request = conn.recv()
+		except EOFError:
+			break
+		if request is None: break
+		conn.send(evaluate(request))
+
+class Worker:
+	# One process, one request at a time. Waiting on it blocks, so the server
+	# calls run from a thread
+	def __init__(self):
+		self.start()
+
+	def start(self):
+		context = multiprocessing.get_context(START_METHOD)
+		self.conn, child_conn = context.Pipe()
+		self.process = context.Process(target=worker_main, args=(child_conn,), daemon=True)
+		self.process.start()
+		child_conn.close()
+
+	def restart(self):
+		self.process.kill()
+		self.process.join()
+		self.conn.close()
+		self.start()
+
+	def run(self, request, timeout):
+		try:
+			self.conn.send(request)
+			if self.conn.poll(timeout):
+				return self.conn.recv()
+		except (EOFError, OSError):
+			self.restart()
+			return None, 'Internal error: worker process died'
+
+		# There is no stopping a runaway WHILE (or a huge '^') from the outside
+		# other than stopping the whole process
+		self.restart()
+		return None, f'Timeout: took longer than {timeout}s'
+
+	def close(self):
+		try:
+			self.conn.send(None)
+		except OSError:
+			pass
+		self.process.join(1)
+		if self.process.is_alive(): self.process.kill()
+
+class Server:
+	MAX_LINE = 1024 * 1024
+
+	def __init__(self, workers=None, timeout=5.0, max_pending=64):
+		self.size = workers or os.cpu_count() or 1
+		self.timeout = timeout
+		# Requests read from one connection and not yet answered; past this the
+		# server stops reading it, and TCP pushes back on the client
+		self.max_pending = max_pending
+		self.workers = None
+		self.threads = None
+
+	async def start(self, host='127.0.0.1', port=8765, path=None):
+		loop = asyncio.get_running_loop()
+		self.threads = ThreadPoolExecutor(self.size)
+		self.workers = asyncio.Queue()
+		for worker in await asyncio.gather(*(loop.run_in_executor(self.threads, Worker) for _ in range(self.size))):
+			self.workers.put_nowait(worker)
+
+		if path:
+			return await asyncio.start_unix_server(self.handle, path, limit=self.MAX_LINE)
+		return await asyncio.start_server(self.handle, host, port, limit=self.MAX_LINE)
+
+	async def close(self):
+		loop = asyncio.get_running_loop()
+		workers = []
+		while len(workers) < self.size:
+			workers.append(await self.workers.get())
+		await asyncio.gather(*(loop.run_in_executor(self.threads, worker.close) for worker in workers))
+		self.threads.shutdown()
+
+	async def handle(self, reader, writer):
+		pending = asyncio.Semaphore(self.max_pending)
+		write_lock = asyncio.Lock()
+		tasks = set()
+
+		try:
+			while True:
+				await pending.acquire()
+
+				try:
+					line = await reader.readline()
+				except ValueError:
+					await self.send(writer, write_lock, {'id': None, 'value': None, 'error': 'Invalid request: line too long'})
+					break
+
+				if not line: break
+				if not line.strip():
+					pending.release()
+					continue
+
+				task = asyncio.create_task(self.respond(line, writer, write_lock, pending))
+				tasks.add(task)
+				task.add_done_callback(tasks.discard)
+
+			if tasks: await asyncio.gather(*tasks)
+		except ConnectionError:
+			for task in tasks: task.cancel()
+		finally:
+			writer.close()
+
+	async def respond(self, line, writer, write_lock, pending):
+		try:
+			try:
+				response = await self.evaluate(line)
+				await self.send(writer, write_lock, response)
+			except ConnectionError:
+				raise
+			except Exception as e:
+				# Every request gets an answer, even if the server itself failed
+				# on it; nothing of the failed response was written
+				error = f'Internal error: {type(e).__name__}: {e}'
+				await self.send(writer, write_lock, {'id': request_id(line), 'value': None, 'error': error})
+		finally:
+			pending.release()
+
+	async def evaluate(self, line):
+		try:
+			request = json.loads(line, parse_constant=reject_constant)
+		except ValueError as e:
+			return {'id': None, 'value': None, 'error': f'Invalid request: {e}'}
+
+		if not isinstance(request, dict) or not isinstance(request.get('text'), str):
+			return {'id': None, 'value': None, 'error': "Invalid request: expected an object with a 'text' string"}
+
+		request_id = request.get('id')
+		if not isinstance(request.get('variables', {}), dict):
+			return {'id': request_id, 'value': None, 'error': "Invalid request: 'variables' is not an object"}
+		if request.get('engine', 'vm') not in ('interpreter', 'closure', 'vm'):
+			return {'id': request_id, 'value': None, 'error': f"Invalid request: no '{request['engine']}' engine"}
+
+		timeout = request.get('timeout')
+		if not isinstance(timeout, (int, float)) or not 0 < timeout < self.timeout: timeout = self.timeout
+
+		loop = asyncio.get_running_loop()
+		worker = await self.workers.get()
+		# If the client goes away the worker still finishes (or times out)
+		# before another request can have it
+		future = loop.run_in_executor(self.threads, worker.run, request, timeout)
+		future.add_done_callback(lambda _: self.workers.put_nowait(worker))
+		value, error = await asyncio.shield(future)
+
+		return {'id': request_id, 'value': value, 'error': error}
+
+	async def send(self, writer, write_lock, response):
+		async with write_lock:
+			writer.write(json.dumps(response, allow_nan=False).encode() + b'\n')
+			await writer.drain()
+
+async def serve(address, workers=None, timeout=5.0):
+	server = Server(workers, timeout)
+	if address.isdigit():
+		listener = await server.start(port=int(address))
+	else:
+		listener = await server.start(path=address)
+
+	print(f'calc server on {address}, {server.size} workers, {timeout}s timeout')
+	try:
+		async with listener:
+			await listener.serve_forever()
+	finally:
+		await server.close()
+
+if __name__ == '__main__':
+	address = sys.argv[1] if len(sys.argv) > 1 else '8765'
+	workers = int(sys.argv[2]) if len(sys.argv) > 2 else None
+	timeout = float(sys.argv[3]) if len(sys.argv) > 3 else 5.0
+
+	try:
+		asyncio.run(serve(address, workers, timeout))
+	except KeyboardInterrupt:
+		pass
@@ -0,0 +1,126 @@
+# Pruebas de los motores: el mismo corpus por 'interpreter', 'closure' y 'vm', con y sin optimizar,
+# tiene que dar los mismos valores, variables y errores
+# python3 -m unittest discover tests
+
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import calc
+
+ENGINES = ('interpreter', 'closure', 'vm')
+
+# Run in every session before the program under test
+SETUP = ['VAR a = 7', 'VAR b = 2.5', 'VAR s = "ab"', 'VAR zero = 0', 'VAR t = 0']
+
+CORPUS = [
+	# Operators
+	'1 + 2 * 3 - 4 / 8', '2 ^ 3 ^ 2', '-2 ^ 2', '2 ^ -1', '(1 + 2) * (3 - 4) / 5', '7 / 2', '10 ^ 20 * 10 ^ 20',
+	'0.1 + 0.2', '1 == 1.0', '1 != 2', '3 < 2', '3 > 2', '2 <= 2', '2 >= 3', '1 AND 0', '1 OR 0', '2 AND 3',
+	'0 OR 2.5', '2.5 AND 3.7', 'NOT 0', 'NOT 5', '--1', '+-+1', '0 - 0.0', '-0.0', 'a + b', 'a * b - a / b',
+	'a ^ 2 > b * 10 AND a != 7 OR b == 2.5', '"ab" + "cd"', '"ab" * 3', '"ab" * 0', 's * a', 's + s + s',
+	'TRUE AND FALSE', 'NULL', 'TRUE + 1', '1 + 1 + 1 + 1 + 1 + a', '(0 - 8) ^ 0.5', '10 ^ 400',
+	# Illegal operations
+	'"a" - 1', '"a" * "b"', '1 + "a"', '"a" == "a"', 'TRUE + "a"', 's * b', 'NOT s', '-s', 'a < s',
+	# Division by zero
+	'1 / 0', '1 / (a - 7)', 'a / 0.0', '5 / zero', '(1 + 2) / (zero * 3)', '1 / 0 + "a"',
+	# Undefined names
+	'x', 'x + 1', 'VAR y = x', 'a + undefined_name * 2', '1 / 0 + x', 'x + 1 / 0',
+	# Assignments
+	'VAR c = a * 2', 'VAR c = VAR d = 3', '(VAR c = 4) + c', 'VAR a = a + 1', 'VAR s = s * 2',
+	# IF
+	'IF a > 5 THEN "big" ELSE "small"', 'IF 0 THEN 1', 'IF 0 THEN 1 ELIF 0 THEN 2 ELSE 3', 'IF 0 THEN 1 ELIF 1 THEN 2',
+	'IF a THEN 1 / 0 ELSE 2', 'IF x THEN 1', 'IF s THEN 1 ELSE 2', 'IF "" THEN 1 ELSE 2', '1 + IF 1 THEN 2 ELSE 3',
+	'IF 1 THEN VAR c = 5 ELSE VAR d = 6',
+	# FOR
+	'FOR i = 0 TO 5 THEN VAR t = t + i', 'FOR i = 5 TO 0 STEP -1 THEN VAR t = t + i', 'FOR i = 0 TO 2.5 THEN VAR t = t + i',
+	'FOR i = 0.5 TO 3 STEP 0.5 THEN VAR t = t + i', 'FOR i = 0 TO 10 STEP 3 THEN VAR t = i', 'FOR i = 0 TO 0 THEN 1 / 0',
+	'FOR i = 0 TO 5 THEN IF i == 3 THEN 1 / 0 ELSE VAR t = t + i', 'FOR i = 0 TO 3 THEN FOR j = 0 TO i THEN VAR t = t + j',
+	'FOR i = 0 TO 3 THEN VAR i = 10', 'FOR i = x TO 3 THEN 1', 'FOR i = 0 TO 3 STEP zero - 1 THEN 1', 'FOR i = 3 TO 0 THEN 1',
+	'VAR t = FOR i = 0 TO 3 THEN i',
+	# WHILE
+	'WHILE t < 10 THEN VAR t = t + 3', 'WHILE 0 THEN 1', 'WHILE t < 5 THEN VAR t = t + "a"', 'WHILE t < 3 THEN VAR t = t + 1 / (2 - t)',
+	'WHILE x THEN 1', 'WHILE t < 4 THEN FOR i = 0 TO t + 1 THEN VAR t = t + 1',
+	# Syntax errors
+	'1 +', '(1 + 2', 'IF 1 THEN 2 ELIF', 'IF 1 2', 'VAR = 3', 'VAR a 3', 'FOR i 0 TO 1 THEN 1', 'FOR i = 0 1', 'FOR = 1',
+	'WHILE 1 2', '1 2', ')', '', 'a (1', 'a(1, 2)', 'a()', '1 AND', '1 AND AND 2', '1 + * 2', 'VAR', 'IF', '((((1))))) + 1',
+	# Lex errors
+	'1 @ 2', '!', '1 ! 2', '"abc', '3.4.5', 'a $ b', '1 + 2 #'
+]
+
+def run_all(text):
+	# (engine, optimize) -> what the program gave and left in its session
+	results = {}
+	for engine in ENGINES:
+		for optimize in (True, False):
+			session = calc.Session(engine=engine, optimize=optimize)
+			for setup in SETUP:
+				session.run('<setup>', setup, cache=False)
+
+			try:
+				value, error = session.run('<test>', text, cache=False)
+				error = error.as_string() if error else None
+			except Exception as e:
+				# Some errors still come through as Python exceptions ('"a" * 2.5'),
+				# the same one from every engine
+				value, error = None, f'{type(e).__name__}: {e}'
+
+			variables = {name: repr(value) for name, value in session.variables().items()}
+			results[(engine, optimize)] = (repr(value), error, variables)
+	return results
+
+class EnginesTest(unittest.TestCase):
+	def test_corpus_agrees_across_engines(self):
+		for text in CORPUS:
+			with self.subTest(text=text):
+				results = run_all(text)
+				expected = results[('interpreter', False)]
+				for key, result in results.items():
+					self.assertEqual(result, expected, key)
+
+	def test_values_and_errors(self):
+		# Pinned down, so the engines can not all drift together
+		cases = {
+			'1 + 2 * 3 - 4 / 8': ('6.5', None),
+			'2 ^ 3 ^ 2': ('512', None),
+			'-2 ^ 2': ('-4', None),
+			'"ab" * 3': ('"ababab"', None),
+			'FOR i = 0 TO 5 THEN VAR t = t + i': ('None', None),
+			'IF 0 THEN 1': ('None', None),
+			'1 / (a - 7)': ('None', 'Runtime Error: Can not divide anything by 0'),
+			'a + undefined_name * 2': ('None', "Runtime Error: 'undefined_name' is not defined"),
+			'"a" - 1': ('None', 'Runtime Error: Illegal operation'),
+			'1 +': ('None', 'Invalid Syntax'),
+			'(1 + 2': ('None', "Invalid Syntax: Expected ')'"),
+			'1 @ 2': ('None', "Illegal Character: '@'"),
+			'!': ('None', "Expected Character: '=' (after '!')")
+		}
+		for text, (value, error) in cases.items():
+			with self.subTest(text=text):
+				for result, message, _ in run_all(text).values():
+					self.assertEqual(result, value)
+					if error is None:
+						self.assertIsNone(message)
+					else:
+						self.assertIn(error, message)
+
+		results = run_all('FOR i = 0 TO 5 THEN VAR t = t + i')
+		self.assertTrue(all(variables['t'] == '10' for _, _, variables in results.values()))
+
+	def test_deep_nesting(self):
+		# The parser and the VM take any depth; the other engines report it
+		depth = 100000
+		for text in ['(' * depth + '1' + ')' * depth, 'IF 1 THEN ' * depth + '5', '-' * depth + '1', ' + '.join(['1'] * depth)]:
+			with self.subTest(text=text[:20]):
+				for optimize in (True, False):
+					value, error = calc.run('<deep>', text, engine='vm', optimize=optimize, cache=False)
+					self.assertIsNone(error)
+
+					for engine in ('interpreter', 'closure'):
+						value, error = calc.run('<deep>', text, engine=engine, optimize=optimize, cache=False)
+						if error: self.assertIn('Too deeply nested', error.as_string())
+
+if __name__ == '__main__':
+	unittest.main()
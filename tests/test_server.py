@@ -0,0 +1,123 @@
+# Pruebas del servidor: pipelining, timeouts, requests invalidos y como se codifican los valores
+# python3 -m unittest discover tests
+
+import asyncio
+import json
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import server
+
+class ServerTest(unittest.IsolatedAsyncioTestCase):
+	async def asyncSetUp(self):
+		self.server = server.Server(workers=2, timeout=5.0)
+		self.listener = await self.server.start(port=0)
+		port = self.listener.sockets[0].getsockname()[1]
+		self.reader, self.writer = await asyncio.open_connection('127.0.0.1', port)
+
+	async def asyncTearDown(self):
+		self.writer.close()
+		await self.writer.wait_closed()
+		self.listener.close()
+		await self.listener.wait_closed()
+		await self.server.close()
+
+	async def send(self, *lines):
+		# Every line in a single write, so the server sees them pipelined
+		self.writer.write(b''.join((line if isinstance(line, bytes) else json.dumps(line).encode()) + b'\n' for line in lines))
+		await self.writer.drain()
+
+	async def receive(self, count):
+		responses = []
+		for _ in range(count):
+			line = await asyncio.wait_for(self.reader.readline(), 30)
+			responses.append(json.loads(line))
+		return responses
+
+	async def evaluate(self, request):
+		await self.send(request)
+		return (await self.receive(1))[0]
+
+	async def test_pipelined_requests_are_answered_by_id(self):
+		await self.send(
+			{'id': 'slow', 'text': 'FOR i = 0 TO 200000 THEN i', 'engine': 'interpreter'},
+			{'id': 1, 'text': 'x * 2', 'variables': {'x': 21}},
+			{'id': 2, 'text': '"ab" * 2'},
+			{'id': 3, 'text': '1 / 0'}
+		)
+		responses = {response['id']: response for response in await self.receive(4)}
+
+		self.assertEqual(set(responses), {'slow', 1, 2, 3})
+		self.assertEqual(responses[1], {'id': 1, 'value': 42, 'error': None})
+		self.assertEqual(responses[2], {'id': 2, 'value': 'abab', 'error': None})
+		self.assertIn('Can not divide anything by 0', responses[3]['error'])
+		self.assertIsNone(responses['slow']['error'])
+
+	async def test_runaway_program_is_killed_at_its_timeout(self):
+		response = await self.evaluate({'id': 1, 'text': 'WHILE 1 THEN 1', 'timeout': 0.5})
+		self.assertEqual(response['id'], 1)
+		self.assertIsNone(response['value'])
+		self.assertTrue(response['error'].startswith('Timeout'))
+
+		# The worker was replaced, and the connection still works
+		for request_id in range(2, 5):
+			response = await self.evaluate({'id': request_id, 'text': '7 * 6'})
+			self.assertEqual(response, {'id': request_id, 'value': 42, 'error': None})
+
+	async def test_invalid_requests(self):
+		await self.send(
+			b'{not json',
+			b'[1, 2]',
+			{'id': 1},
+			{'id': 2, 'text': 'x', 'variables': [1]},
+			{'id': 3, 'text': 'x', 'variables': {'x': [1]}},
+			{'id': 4, 'text': '1', 'engine': 'jit'},
+			b'{"id": 5, "text": "x", "variables": {"x": NaN}}',
+			{'id': 6, 'text': '1 +'}
+		)
+		responses = await self.receive(8)
+
+		errors = [response['error'] for response in responses]
+		self.assertEqual(sum(error.startswith('Invalid request') for error in errors), 7)
+		self.assertTrue(all(response['value'] is None for response in responses))
+		self.assertIn('Invalid Syntax', next(response['error'] for response in responses if response['id'] == 6))
+
+	async def test_value_encoding(self):
+		cases = {
+			'2 ^ 100': 2 ** 100,
+			'7 / 2': 3.5,
+			'"a" + "b"': 'ab',
+			'IF 0 THEN 1': None
+		}
+		for request_id, (text, value) in enumerate(cases.items()):
+			response = await self.evaluate({'id': request_id, 'text': text})
+			self.assertEqual(response, {'id': request_id, 'value': value, 'error': None}, text)
+
+		# No complex numbers, infinities, NaN or ints past Python's digit limit
+		# in JSON; the connection goes on
+		for request_id, text in enumerate(['(0 - 8) ^ 0.5', '10.0 ^ 308 * 10', '0 - 10.0 ^ 308 * 10', '10 ^ 5000', '0 - 10 ^ 5000']):
+			response = await self.evaluate({'id': request_id, 'text': text, 'engine': 'interpreter'})
+			self.assertEqual(response['id'], request_id, text)
+			self.assertIsNone(response['value'], text)
+			self.assertTrue(response['error'].startswith('Invalid result'), text)
+
+		self.assertEqual(await self.evaluate({'id': 'last', 'text': '1 + 1'}), {'id': 'last', 'value': 2, 'error': None})
+
+	async def test_server_failure_is_still_answered(self):
+		evaluate = self.server.evaluate
+
+		async def failing(line):
+			raise ValueError('broken')
+
+		self.server.evaluate = failing
+		response = await self.evaluate({'id': 7, 'text': '1'})
+		self.assertEqual(response, {'id': 7, 'value': None, 'error': 'Internal error: ValueError: broken'})
+
+		self.server.evaluate = evaluate
+		self.assertEqual(await self.evaluate({'id': 8, 'text': '1 + 1'}), {'id': 8, 'value': 2, 'error': None})
+
+if __name__ == '__main__':
+	unittest.main()